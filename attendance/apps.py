@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class AttendanceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'attendance'
\ No newline at end of file
+    name = 'attendance'
+
+    def ready(self):
+        from . import signals, sqlite  # noqa: F401
@@ -0,0 +1,130 @@
+# attendance/async_views.py
+# Async versions of the hot endpoints (start, break toggle, end, status,
+# revive) for ASGI deployments.
+#
+# They share the logic in views.py (_start_attendance() & co.) and only
+# replace the request handling: authentication runs on the event loop with
+# the cached user / async ORM, and the session logic runs inline when the
+# store does no I/O (MemorySessionStore) or in a worker thread when it does
+# (DatabaseSessionStore, inline CSV export). urls.py picks these views when
+# settings.ATTENDANCE_ASYNC_VIEWS is on, which asgi.py sets by default.
+
+import logging
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import CachedJWTAuthentication, aauthenticate_token
+from .store import aget_session_store, db_sync_to_async
+from .views import (
+    _attendance_status, _beacon_body, _end_attendance,
+    _revive_attendance, _start_attendance, _toggle_break,
+)
+
+logger = logging.getLogger("attendance")
+
+_JWT_AUTH = CachedJWTAuthentication()
+
+
+async def _run(fn, *args, blocking=False):
+    """Call a views.py endpoint function, off the event loop if it may block."""
+    store = await aget_session_store()
+    if blocking or getattr(store, "blocking", True):
+        # any pool thread will do: the store locks what it shares, and the
+        # default (one thread for every sync call) would queue all users
+        return await db_sync_to_async(fn)(*args)
+    return fn(*args)
+
+
+def _json(result):
+    payload, status = result
+    return JsonResponse(payload, status=status)
+
+
+class AsyncAttendanceView(View):
+    """Base for the async endpoints: token auth only, so no CSRF check (like DRF's APIView)."""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def bearer_user(self, request):
+        """User from the Authorization header, or None."""
+        try:
+            return await _JWT_AUTH.aauthenticate(request)
+        except AuthenticationFailed:
+            return None
+
+    async def beacon_user(self, request, body):
+        """Header or body token, like views._authenticate_any()."""
+        user = await self.bearer_user(request)
+        if user is not None:
+            return user, "jwt_token"
+        token = body.get("token")
+        if not token:
+            return None, "none"
+        return await aauthenticate_token(token)
+
+
+def _unauthorized(request):
+    resp = JsonResponse({"detail": "Authentication credentials were not provided or are invalid."}, status=401)
+    # the challenge DRF sends with its 401s (Bearer realm="api")
+    resp["WWW-Authenticate"] = _JWT_AUTH.authenticate_header(request)
+    return resp
+
+
+class AsyncStartAttendanceView(AsyncAttendanceView):
+    async def post(self, request):
+        user = await self.bearer_user(request)
+        if user is None:
+            return _unauthorized(request)
+        return _json(await _run(_start_attendance, user))
+
+
+class AsyncToggleBreakView(AsyncAttendanceView):
+    async def post(self, request):
+        user = await self.bearer_user(request)
+        if user is None:
+            return _unauthorized(request)
+        return _json(await _run(_toggle_break, user))
+
+
+class AsyncCurrentStatusView(AsyncAttendanceView):
+    async def get(self, request):
+        user = await self.bearer_user(request)
+        if user is None:
+            return _unauthorized(request)
+        return _json(await _run(_attendance_status, user))
+
+
+class AsyncEndAttendanceView(AsyncAttendanceView):
+    async def post(self, request):
+        body = _beacon_body(request)
+        if body is None:
+            return JsonResponse({"detail": "Request body too large"}, status=413)
+
+        user, via = await self.beacon_user(request, body)
+        if not user:
+            logger.warning("EndAttendance auth failed via=%s", via)
+            return JsonResponse({"detail": "Authentication failed"}, status=401)
+        logger.debug("EndAttendance authenticated via=%s user_id=%s", via, user.id)
+
+        # with no export delay the CSV row is written inside the call
+        inline_csv = getattr(settings, "ATTENDANCE_EXPORT_DELAY", 2.0) <= 0
+        return _json(await _run(_end_attendance, user, body, blocking=inline_csv))
+
+
+class AsyncReviveAttendanceView(AsyncAttendanceView):
+    async def post(self, request):
+        body = _beacon_body(request)
+        if body is None:
+            return JsonResponse({"detail": "Request body too large"}, status=413)
+
+        user, via = await self.beacon_user(request, body)
+        if not user:
+            logger.warning("ReviveAttendance auth failed via=%s", via)
+            return JsonResponse({"detail": "Authentication failed"}, status=401)
+        return _json(await _run(_revive_attendance, user))
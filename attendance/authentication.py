@@ -0,0 +1,252 @@
+# attendance/authentication.py
+# JWT authentication with a small per-process user cache.
+#
+# simplejwt's JWTAuthentication loads the User row on every request; the
+# dashboard polls status/ and auth/me/ back to back, so the same user is
+# looked up over and over. CachedJWTAuthentication validates the token as
+# usual but keeps the resolved user for ATTENDANCE_AUTH_CACHE_TTL seconds
+# (LRU, ATTENDANCE_AUTH_CACHE_SIZE entries).
+#
+# The cache is per process. Admin views that change a user call
+# invalidate_cached_user(), which only reaches the worker that served them:
+# other workers keep the old user (a demoted admin still passes
+# IsAdminUser, a deleted one still authenticates) until the entry expires.
+# That window is the TTL, so keep it short when running several workers.
+#
+# authenticate_token() is the token check used by the beacon endpoints.
+
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+logger = logging.getLogger("attendance")
+
+# user_id → (expires_at, user)
+_USERS = OrderedDict()
+_USERS_LOCK = threading.Lock()
+
+
+def _ttl():
+    return getattr(settings, "ATTENDANCE_AUTH_CACHE_TTL", 5.0)
+
+
+def _max_size():
+    return getattr(settings, "ATTENDANCE_AUTH_CACHE_SIZE", 1024)
+
+
+def invalidate_cached_user(user_id=None):
+    """Forget one cached user (or all of them) in this process; other workers wait for the TTL."""
+    with _USERS_LOCK:
+        if user_id is None:
+            _USERS.clear()
+        else:
+            _USERS.pop(str(user_id), None)
+
+
+def _cached_user(key):
+    with _USERS_LOCK:
+        hit = _USERS.get(key)
+        if hit is not None and hit[0] > time.monotonic():
+            _USERS.move_to_end(key)
+            # each request gets its own instance, views may set attributes on it
+            return copy.copy(hit[1])
+    return None
+
+
+def _remember_user(key, user, ttl):
+    with _USERS_LOCK:
+        _USERS[key] = (time.monotonic() + ttl, user)
+        _USERS.move_to_end(key)
+        while len(_USERS) > _max_size():
+            _USERS.popitem(last=False)
+    return copy.copy(user)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that reuses recently loaded users instead of querying each time."""
+
+    def get_user(self, validated_token):
+        ttl = _ttl()
+        if ttl <= 0 or api_settings.USER_ID_CLAIM not in validated_token:
+            # uncached, or let simplejwt raise its usual InvalidToken
+            return super().get_user(validated_token)
+
+        key = str(validated_token[api_settings.USER_ID_CLAIM])
+        user = _cached_user(key)
+        if user is None:
+            user = _remember_user(key, super().get_user(validated_token), ttl)
+        return user
+
+    # ---- async views (async_views.py) ----
+
+    async def aauthenticate(self, request):
+        """authenticate() for async views; returns the user or None without a Bearer header."""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        return await self.aget_user(self.get_validated_token(raw_token))
+
+    async def aget_user(self, validated_token):
+        """get_user() with the same checks, loading a cache miss through the async ORM."""
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        ttl = _ttl()
+        key = str(user_id)
+        if ttl > 0:
+            user = _cached_user(key)
+            if user is not None:
+                return user
+
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and (
+            validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+        ):
+            raise AuthenticationFailed("The user's password has been changed.", code="password_changed")
+
+        return _remember_user(key, user, ttl) if ttl > 0 else user
+
+
+# -------------------------------------------------------------
+# Beacon authentication
+# -------------------------------------------------------------
+#
+# end/ and revive_if_recent/ are AllowAny (navigator.sendBeacon cannot set
+# headers reliably), so they authenticate the token themselves. Those
+# endpoints see a lot of junk and expired tokens; a rejected token is
+# remembered for ATTENDANCE_BEACON_REJECT_TTL seconds and turned away without
+# decoding it again.
+
+# reused for every beacon; the authenticator instances keep no per-request state
+_JWT_AUTH = CachedJWTAuthentication()
+
+# token → expires_at
+_REJECTED = OrderedDict()
+_REJECTED_LOCK = threading.Lock()
+_REJECTED_MAX = 4096
+
+
+def _jwt_user(token):
+    return _JWT_AUTH.get_user(_JWT_AUTH.get_validated_token(token))
+
+
+def _drf_token_user(token):
+    from rest_framework.authentication import TokenAuthentication
+    user, _ = TokenAuthentication().authenticate_credentials(token)
+    return user
+
+
+async def _ajwt_user(token):
+    return await _JWT_AUTH.aget_user(_JWT_AUTH.get_validated_token(token))
+
+
+_BEACON_BACKENDS = {
+    "jwt_token": _jwt_user,
+    "drf_token": _drf_token_user,
+}
+
+_ASYNC_BEACON_BACKENDS = {
+    "jwt_token": _ajwt_user,
+    "drf_token": sync_to_async(_drf_token_user),
+}
+
+
+def _beacon_backends(registry=_BEACON_BACKENDS):
+    names = getattr(settings, "ATTENDANCE_BEACON_AUTH_BACKENDS", None)
+    if names is None:
+        # DRF's Token model only exists when its app is installed
+        names = ["jwt_token"]
+        if "rest_framework.authtoken" in settings.INSTALLED_APPS:
+            names.append("drf_token")
+    return [(name, registry[name]) for name in names]
+
+
+def _recently_rejected(token, now):
+    with _REJECTED_LOCK:
+        expires = _REJECTED.get(token)
+        if expires is None:
+            return False
+        if expires > now:
+            return True
+        del _REJECTED[token]
+        return False
+
+
+def _reject(token, now):
+    ttl = getattr(settings, "ATTENDANCE_BEACON_REJECT_TTL", 60.0)
+    if ttl <= 0:
+        return
+    with _REJECTED_LOCK:
+        _REJECTED[token] = now + ttl
+        _REJECTED.move_to_end(token)
+        while len(_REJECTED) > _REJECTED_MAX:
+            _REJECTED.popitem(last=False)
+
+
+def authenticate_token(token):
+    """
+    Resolve a raw beacon token with the configured backends.
+
+    Returns (user, backend name) or (None, "none").
+    """
+    if not isinstance(token, str):
+        return None, "none"
+
+    now = time.monotonic()
+    if _recently_rejected(token, now):
+        return None, "none"
+
+    for name, backend in _beacon_backends():
+        try:
+            return backend(token), name
+        except AuthenticationFailed:
+            continue
+        except Exception:
+            # a backend that is broken (e.g. database down) says nothing about the token
+            logger.exception("Beacon authentication backend %s failed", name)
+            return None, "none"
+
+    _reject(token, now)
+    return None, "none"
+
+
+async def aauthenticate_token(token):
+    """authenticate_token() for async views."""
+    if not isinstance(token, str):
+        return None, "none"
+
+    now = time.monotonic()
+    if _recently_rejected(token, now):
+        return None, "none"
+
+    for name, backend in _beacon_backends(_ASYNC_BEACON_BACKENDS):
+        try:
+            return await backend(token), name
+        except AuthenticationFailed:
+            continue
+        except Exception:
+            logger.exception("Beacon authentication backend %s failed", name)
+            return None, "none"
+
+    _reject(token, now)
+    return None, "none"
@@ -0,0 +1,125 @@
+# attendance/events.py
+# In-process pub/sub behind the events/ Server-Sent Events stream.
+#
+# The attendance views publish an event after every start / break / end /
+# revive on two channels: "user:<id>" (that user's own tabs) and "admin"
+# (every admin dashboard). Subscribers are per-connection queues; publish()
+# is called from request threads and never blocks on a slow client: a full
+# queue drops the event and the client resyncs when it reconnects.
+#
+# Events only reach clients connected to the same process. Under several
+# workers a client sees the changes made through its own worker.
+#
+# EventSource cannot send an Authorization header, so the stream URL carries
+# a stream token instead of the access token: a signed user id that is only
+# accepted for ATTENDANCE_EVENTS_TOKEN_MAX_AGE seconds after it was issued
+# (it is checked when the stream connects).
+
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+ADMIN_CHANNEL = "admin"
+QUEUE_SIZE = 100
+STREAM_TOKEN_SALT = "attendance.events"
+
+
+def user_channel(user_id):
+    return f"user:{user_id}"
+
+
+class AsyncSubscription:
+    """One stream's subscription on the event loop: events are awaited with get(timeout)."""
+
+    def __init__(self, channels):
+        self.channels = tuple(channels)
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def _put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+    def deliver(self, event):
+        try:
+            self._loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # loop already closed: the connection is gone
+            pass
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs = {}  # channel → set of subscriptions
+
+    def subscribe(self, sub):
+        with self._lock:
+            for channel in sub.channels:
+                self._subs.setdefault(channel, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            for channel in sub.channels:
+                subs = self._subs.get(channel)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._subs[channel]
+
+    def publish(self, channels, event):
+        with self._lock:
+            targets = set()
+            for channel in channels:
+                targets.update(self._subs.get(channel, ()))
+        for sub in targets:
+            sub.deliver(event)
+
+
+EVENT_BUS = EventBus()
+
+
+def publish_session_event(user, kind, session):
+    """Tell the user's own streams and the admin stream that ``session`` changed."""
+    EVENT_BUS.publish((user_channel(user.id), ADMIN_CHANNEL), {
+        "type": kind,
+        "user_id": user.id,
+        "username": user.username,
+        "session": session,
+        "at": timezone.now().isoformat(),
+    })
+
+
+def format_sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def stream_token_max_age():
+    return getattr(settings, "ATTENDANCE_EVENTS_TOKEN_MAX_AGE", 60)
+
+
+def issue_stream_token(user):
+    return signing.dumps(user.id, salt=STREAM_TOKEN_SALT)
+
+
+def stream_token_user_id(token):
+    """The user id in a stream token, or None when it is invalid or expired."""
+    if not token:
+        return None
+    try:
+        return signing.loads(token, salt=STREAM_TOKEN_SALT, max_age=stream_token_max_age())
+    except signing.BadSignature:  # includes SignatureExpired
+        return None
@@ -0,0 +1,424 @@
+# attendance/exports.py
+# Daily CSV export: row building and the csv_exports/attendance_<date>.csv files.
+#
+# A full regeneration (_save_csv_user_date) walks the store for one date.
+# Ending a session does not: queue_session() hands the encoded row to
+# EXPORT_QUEUE, a background thread that batches rows per date and writes
+# them at most ATTENDANCE_EXPORT_DELAY seconds later through _record_rows(),
+# which keeps the encoded rows of each day it has written in memory and only
+# appends / patches the rows of the sessions that changed.
+
+import csv
+import io
+import os
+import time
+import atexit
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+from django.contrib.auth.models import User
+
+from .records import from_epoch_us, to_epoch_us
+from .store import db_sync_to_async, get_session_store
+
+logger = logging.getLogger("attendance")
+
+CSV_HEADER = [
+    "Username", "Full Name",
+    "Session Start", "Session End",
+    "Status", "Duration",
+    "Break Count", "Break Details"
+]
+
+
+# -------------------------------------------------------------
+# Row building
+# -------------------------------------------------------------
+
+
+_US_PER_MINUTE = 60_000_000
+
+
+class _TimeFormatter:
+    """
+    Formats epoch-µs timestamps for the CSV in one zone.
+
+    The zone is resolved once, when the formatter is created; the text only
+    depends on the minute, so each minute is formatted once and memoized.
+    Build one formatter per exported day and pass it to every _session_row()
+    call for that day; the memo grows with the minutes it has seen.
+    """
+
+    def __init__(self, tz=None):
+        self.tz = tz or timezone.get_current_timezone()
+        self._full = {}
+        self._clock = {}
+
+    def _local(self, minute):
+        return from_epoch_us(minute * _US_PER_MINUTE).astimezone(self.tz)
+
+    def full(self, us):
+        minute = us // _US_PER_MINUTE
+        txt = self._full.get(minute)
+        if txt is None:
+            txt = self._full[minute] = self._local(minute).strftime("%d %b %Y, %I:%M %p")
+        return txt
+
+    def clock(self, us):
+        minute = us // _US_PER_MINUTE
+        txt = self._clock.get(minute)
+        if txt is None:
+            txt = self._clock[minute] = self._local(minute).strftime("%I:%M %p")
+        return txt
+
+
+def _session_row(username, full_name, s, fmt=None):
+    fmt = fmt or _TimeFormatter()
+    st = s._start
+    et = s._end
+    status = "Active" if s.is_active else "Completed"
+
+    if et is None:
+        et_txt = "—"
+        minutes = (to_epoch_us(timezone.now()) - st) // _US_PER_MINUTE
+    else:
+        et_txt = fmt.full(et)
+        minutes = (et - st) // _US_PER_MINUTE
+
+    br_lines = [
+        f"{fmt.clock(b._start)} → {fmt.clock(b._end) if b._end is not None else '—'}"
+        for b in s.breaks
+    ]
+
+    return [
+        username, full_name,
+        fmt.full(st), et_txt,
+        status,
+        f"{minutes // 60}h {minutes % 60}m",
+        len(s.breaks),
+        "\n".join(br_lines)
+    ]
+
+
+# -------------------------------------------------------------
+# User display names
+# -------------------------------------------------------------
+
+# user_id → (username, full name); dropped by invalidate_user_name() when an
+# admin view changes or deletes a user.
+_USER_NAMES = {}
+_USER_NAMES_MAX = 10000
+_USER_NAMES_LOCK = threading.Lock()
+
+
+def _user_names(user_ids):
+    """{user_id: (username, full_name)} for the ids that exist, one query for the misses."""
+    with _USER_NAMES_LOCK:
+        found = {uid: _USER_NAMES[uid] for uid in user_ids if uid in _USER_NAMES}
+    missing = [uid for uid in user_ids if uid not in found]
+    if missing:
+        fetched = {
+            u.id: (u.username, u.get_full_name())
+            for u in User.objects.only("id", "username", "first_name", "last_name").filter(id__in=missing)
+        }
+        with _USER_NAMES_LOCK:
+            if len(_USER_NAMES) + len(fetched) > _USER_NAMES_MAX:
+                _USER_NAMES.clear()
+            _USER_NAMES.update(fetched)
+        found.update(fetched)
+    return found
+
+
+def invalidate_user_name(user_id=None):
+    """Forget one cached display name (or all of them)."""
+    with _USER_NAMES_LOCK:
+        if user_id is None:
+            _USER_NAMES.clear()
+        else:
+            _USER_NAMES.pop(int(user_id), None)
+
+
+def _keyed_rows_for_date(date, fmt=None):
+    """Yield (session_id, row) for every session started on ``date``."""
+    day = get_session_store().sessions_for_date(date)
+    fmt = fmt or _TimeFormatter()
+
+    # uid stored as string keys
+    ids = []
+    for uid in day:
+        try:
+            ids.append(int(uid))
+        except Exception:
+            pass
+    names = _user_names(ids) if ids else {}
+
+    for uid, sessions in day.items():
+        try:
+            username, full_name = names[int(uid)]
+        except (KeyError, ValueError):
+            username, full_name = f"user_{uid}", ""
+
+        for s in sessions:
+            yield s.id, _session_row(username, full_name, s, fmt)
+
+
+def _rows_for_date(date, fmt=None):
+    for _, row in _keyed_rows_for_date(date, fmt):
+        yield row
+
+
+# -------------------------------------------------------------
+# Streaming
+# -------------------------------------------------------------
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class _Echo:
+    """File-like object whose write() hands the encoded line straight back."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(dates):
+    """
+    Yield the CSV for ``dates`` (header, then each day's rows) in ~64 KB chunks.
+
+    Only one day's sessions (and one day's formatter memo) are held at a
+    time, so memory stays flat however long the range is.
+    """
+    w = csv.writer(_Echo())
+    tz = timezone.get_current_timezone()
+    buf = [w.writerow(CSV_HEADER)]
+    size = 0
+    for date in dates:
+        fmt = _TimeFormatter(tz)
+        for row in _rows_for_date(date, fmt):
+            line = w.writerow(row)
+            buf.append(line)
+            size += len(line)
+            if size >= STREAM_CHUNK_SIZE:
+                yield "".join(buf)
+                buf, size = [], 0
+    if buf:
+        yield "".join(buf)
+
+
+async def aiter_csv(dates):
+    """
+    iter_csv() for ASGI responses.
+
+    Django buffers a synchronous iterator completely before an ASGI server
+    sends any of it; this produces the same chunks one at a time in a worker
+    thread, so the first bytes leave as soon as they are ready.
+    """
+    chunks = iter_csv(dates)
+    next_chunk = db_sync_to_async(next)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+# -------------------------------------------------------------
+# Files on disk
+# -------------------------------------------------------------
+
+# date → {"rows": {session_id: encoded line}, "sig": (mtime_ns, size)}, least
+# recently written first. Sessions end on the last day or two, so only the
+# newest _DAY_FILES_MAX days are kept; a row for an older day regenerates it.
+_DAY_FILES = OrderedDict()
+_DAY_FILES_MAX = 4
+_CSV_LOCK = threading.Lock()
+
+
+def _encode(row):
+    buf = io.StringIO()
+    csv.writer(buf).writerow(row)
+    return buf.getvalue()
+
+
+def _csv_path(date):
+    export_dir = Path(settings.CSV_EXPORT_DIR)
+    export_dir.mkdir(exist_ok=True)
+    return export_dir / f"attendance_{date}.csv"
+
+
+def _signature(pathf):
+    try:
+        st = pathf.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _write_atomic(pathf, lines):
+    """Write header + lines to a temp file next to ``pathf`` and rename it in place."""
+    fd, tmp = tempfile.mkstemp(dir=pathf.parent, prefix=pathf.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+            f.write(_encode(CSV_HEADER))
+            f.writelines(lines)
+        os.replace(tmp, pathf)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _save_csv_user_date(date):
+    """Internal helper — re-generate CSV for given date."""
+    rows = {sid: _encode(row) for sid, row in _keyed_rows_for_date(date)}
+    pathf = _csv_path(date)
+
+    with _CSV_LOCK:
+        _write_atomic(pathf, rows.values())
+        _DAY_FILES[date] = {"rows": rows, "sig": _signature(pathf)}
+        _DAY_FILES.move_to_end(date)
+        while len(_DAY_FILES) > _DAY_FILES_MAX:
+            _DAY_FILES.popitem(last=False)
+
+    return str(pathf)
+
+
+def _record_rows(date, lines):
+    """
+    Bring the day file up to date with ``lines`` ({session_id: encoded row}).
+
+    Sessions new to the file are appended; changed ones are patched in the
+    cached rows and the file is rewritten atomically from them. Falls back
+    to a full regeneration when the file was never written by this process
+    or was changed by someone else (another worker, a manual save).
+    """
+    pathf = _csv_path(date)
+
+    with _CSV_LOCK:
+        day = _DAY_FILES.get(date)
+        if day is not None and day["sig"] == _signature(pathf):
+            rows = day["rows"]
+            changed = {sid: line for sid, line in lines.items() if rows.get(sid) != line}
+            if any(sid in rows for sid in changed):
+                rows.update(changed)
+                _write_atomic(pathf, rows.values())
+            elif changed:
+                with pathf.open("a", newline="", encoding="utf-8") as f:
+                    f.writelines(changed.values())
+                rows.update(changed)
+            day["sig"] = _signature(pathf)
+            _DAY_FILES.move_to_end(date)
+            return str(pathf)
+
+    return _save_csv_user_date(date)
+
+
+def _encode_session(user, sess):
+    return sess.start_time.date(), sess.id, _encode(
+        _session_row(user.username, user.get_full_name(), sess)
+    )
+
+
+def queue_session(user, sess):
+    """Schedule the row of ``sess`` for the background writer (or write it now if disabled)."""
+    date, sid, line = _encode_session(user, sess)
+    delay = getattr(settings, "ATTENDANCE_EXPORT_DELAY", 2.0)
+    if delay <= 0:
+        return _record_rows(date, {sid: line})
+    EXPORT_QUEUE.submit(date, sid, line, delay)
+
+
+def invalidate_csv_cache():
+    """Forget cached day rows (after a flush / delete changed history)."""
+    with _CSV_LOCK:
+        _DAY_FILES.clear()
+
+
+# -------------------------------------------------------------
+# Background writer
+# -------------------------------------------------------------
+
+
+class ExportQueue:
+    """
+    In-process, debounced CSV writer.
+
+    Rows are coalesced per date (the newest row of a session wins) and
+    written in one batch ``delay`` seconds after the first pending row, so
+    a file never lags more than ``delay`` behind the store. The worker
+    thread starts on first use and pending rows are flushed at exit.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending = {}  # date → {session_id: encoded line}
+        self._due = None
+        self._thread = None
+        self.enqueued = 0
+        self.flushed = 0
+        self.failed = 0
+
+    def submit(self, date, sid, line, delay):
+        with self._cond:
+            self._pending.setdefault(date, {})[sid] = line
+            self.enqueued += 1
+            if self._due is None:
+                self._due = time.monotonic() + delay
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="attendance-csv-export", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _take(self):
+        batch, self._pending, self._due = self._pending, {}, None
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._due is None:
+                    self._cond.wait()
+                remaining = self._due - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                batch = self._take()
+            self._write(batch)
+
+    def _write(self, batch):
+        for date, lines in batch.items():
+            try:
+                _record_rows(date, lines)
+                ok = True
+            except Exception:
+                logger.exception("Background CSV export failed for date=%s", date)
+                ok = False
+            with self._cond:
+                if ok:
+                    self.flushed += len(lines)
+                else:
+                    self.failed += len(lines)
+
+    def flush(self):
+        """Write everything pending now, on the calling thread."""
+        with self._cond:
+            batch = self._take()
+        self._write(batch)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pending": sum(len(v) for v in self._pending.values()),
+                "pending_dates": len(self._pending),
+                "enqueued": self.enqueued,
+                "flushed": self.flushed,
+                "failed": self.failed,
+            }
+
+
+EXPORT_QUEUE = ExportQueue()
+atexit.register(EXPORT_QUEUE.flush)
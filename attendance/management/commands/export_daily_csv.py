@@ -0,0 +1,123 @@
+# attendance/management/commands/export_daily_csv.py
+# Offline exporter for csv_exports/attendance_<date>.csv.
+#
+# Reads the persisted Attendance / BreakInterval rows directly (chunked
+# iterator() queries), so nightly cron jobs can run outside the web tier:
+#
+#   python manage.py export_daily_csv                    # today
+#   python manage.py export_daily_csv --date 2025-11-25
+#   python manage.py export_daily_csv --start 2025-11-01 --end 2025-11-30
+#   python manage.py export_daily_csv --all --workers 4
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from attendance.exports import _TimeFormatter, _session_row, _encode, _write_atomic
+from attendance.models import Attendance, BreakInterval
+from attendance.store import _attendance_to_record
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise CommandError(f"Invalid date {value!r} (expected YYYY-MM-DD)")
+
+
+def _day_rows(date, chunk_size):
+    """Yield one encoded CSV line per session started on ``date`` (UTC day, like the live export)."""
+    start = datetime.combine(date, time.min, tzinfo=dt_timezone.utc)
+    rows = (
+        Attendance.objects
+        .filter(start_time__gte=start, start_time__lt=start + timedelta(days=1))
+        .select_related("user")
+        .only("id", "start_time", "end_time", "is_active", "last_update", "ended_by_refresh",
+              "user__id", "user__username", "user__first_name", "user__last_name")
+        .prefetch_related(Prefetch("breaks", queryset=BreakInterval.objects.order_by("start_time", "id")))
+        .order_by("user_id", "start_time", "id")
+    )
+    fmt = _TimeFormatter()
+    for a in rows.iterator(chunk_size=chunk_size):
+        yield _encode(_session_row(a.user.username, a.user.get_full_name(), _attendance_to_record(a), fmt))
+
+
+def _export_day(date, output_dir, chunk_size):
+    pathf = Path(output_dir) / f"attendance_{date}.csv"
+    count = 0
+
+    def counted():
+        nonlocal count
+        for line in _day_rows(date, chunk_size):
+            count += 1
+            yield line
+
+    _write_atomic(pathf, counted())
+    return date, count, str(pathf)
+
+
+def _init_worker():
+    # spawn-based pools start a fresh interpreter; fork-based ones are already set up
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = "Export attendance CSV files from the database (one file per day)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="Export a single day (YYYY-MM-DD). Default: today.")
+        parser.add_argument("--start", help="First day of a range (YYYY-MM-DD).")
+        parser.add_argument("--end", help="Last day of a range (YYYY-MM-DD), inclusive.")
+        parser.add_argument("--all", action="store_true", help="Export every day that has sessions.")
+        parser.add_argument("--workers", type=int, default=1, help="Export this many days in parallel processes.")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Rows fetched per database round trip.")
+        parser.add_argument("--output-dir", default=None, help="Target directory. Default: settings.CSV_EXPORT_DIR.")
+
+    def _dates(self, options):
+        if options["all"]:
+            return [
+                d.date()
+                for d in Attendance.objects.datetimes("start_time", "day", tzinfo=dt_timezone.utc)
+            ]
+        if options["start"] or options["end"]:
+            if not (options["start"] and options["end"]):
+                raise CommandError("--start and --end must be given together")
+            start, end = _parse_date(options["start"]), _parse_date(options["end"])
+            if start > end:
+                raise CommandError("--start must not be after --end")
+            return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        if options["date"]:
+            return [_parse_date(options["date"])]
+        return [timezone.now().date()]
+
+    def handle(self, *args, **options):
+        dates = self._dates(options)
+        output_dir = Path(options["output_dir"] or settings.CSV_EXPORT_DIR)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        chunk_size = options["chunk_size"]
+        workers = max(1, options["workers"])
+
+        total = 0
+        if workers == 1 or len(dates) == 1:
+            for d in dates:
+                total += self._report(*_export_day(d, output_dir, chunk_size))
+        else:
+            # children must not share the parent's database connection
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                n = len(dates)
+                for result in pool.map(_export_day, dates, [output_dir] * n, [chunk_size] * n):
+                    total += self._report(*result)
+
+        self.stdout.write(self.style.SUCCESS(f"Exported {len(dates)} day(s), {total} row(s)."))
+
+    def _report(self, date, count, path):
+        self.stdout.write(f"{date}: {count} rows -> {path}")
+        return count
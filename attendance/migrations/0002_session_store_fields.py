@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:04
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='ended_by_refresh',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='attendance',
+            name='last_update',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='attendance',
+            name='start_time',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='breakinterval',
+            name='start_time',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
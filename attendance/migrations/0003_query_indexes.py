@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-17 05:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0002_session_store_fields'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['user', 'start_time', 'id'], name='attendance_user_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user', 'start_time'], name='attendance_open_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['start_time', 'id'], name='attendance_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['start_time', 'id'], name='attendance_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='breakinterval',
+            index=models.Index(fields=['attendance', 'start_time', 'id'], name='break_attendance_start_idx'),
+        ),
+    ]
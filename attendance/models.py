@@ -1,14 +1,30 @@
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 User = settings.AUTH_USER_MODEL
 
 
 class Attendance(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='attendances')
-    start_time = models.DateTimeField(auto_now_add=True)
+    start_time = models.DateTimeField(default=timezone.now)
     end_time = models.DateTimeField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
+    last_update = models.DateTimeField(null=True, blank=True)
+    ended_by_refresh = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # a user's history, newest/oldest first (store: last_session, sessions_between)
+            models.Index(fields=["user", "start_time", "id"], name="attendance_user_start_idx"),
+            # only open sessions (store: active_session, roster)
+            models.Index(fields=["user", "start_time"], condition=models.Q(is_active=True),
+                         name="attendance_open_user_idx"),
+            models.Index(fields=["start_time", "id"], condition=models.Q(is_active=True),
+                         name="attendance_open_idx"),
+            # day / range exports (store: sessions_for_date)
+            models.Index(fields=["start_time", "id"], name="attendance_start_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.start_time.isoformat()}"
@@ -16,9 +32,24 @@ class Attendance(models.Model):
 
 class BreakInterval(models.Model):
     attendance = models.ForeignKey(Attendance, on_delete=models.CASCADE, related_name='breaks')
-    start_time = models.DateTimeField(auto_now_add=True)
+    start_time = models.DateTimeField(default=timezone.now)
     end_time = models.DateTimeField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            # a session's breaks in order (breaks prefetch, save_session)
+            models.Index(fields=["attendance", "start_time", "id"], name="break_attendance_start_idx"),
+        ]
+
     def __str__(self):
         return f"Break({self.attendance.user.username}) {self.start_time.isoformat()}"
+
+
+class TableVersion(models.Model):
+    """A counter bumped on every change to a table; views derive ETags from it."""
+    name = models.CharField(max_length=64, primary_key=True)
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
@@ -0,0 +1,223 @@
+# attendance/records.py
+# Immutable session / break records held by the session store.
+#
+# Records are never changed in place: code that wants to end a break or a
+# session builds the new version with replace() and hands it to the store
+# (save_session), which swaps it in. Anything a reader got from the store
+# therefore stays consistent without being copied.
+#
+# Every worker keeps all sessions in RAM, so the records are kept small:
+# __slots__ instead of a __dict__, timestamps as integer microseconds since
+# the epoch (UTC), both flags packed into one int and interned ids. The
+# datetime attributes are rebuilt on access, always timezone-aware UTC.
+
+import sys
+from array import array
+from itertools import islice
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_US = timedelta(microseconds=1)
+
+_ACTIVE = 1
+_ENDED_BY_REFRESH = 2
+
+
+def to_epoch_us(dt):
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=dt_timezone.utc)
+    return (dt - _EPOCH) // _US
+
+
+def from_epoch_us(us):
+    if us is None:
+        return None
+    return _EPOCH + timedelta(microseconds=us)
+
+
+class Break:
+    __slots__ = ("_start", "_end")
+
+    def __init__(self, start_time, end_time=None):
+        self._start = to_epoch_us(start_time)
+        self._end = to_epoch_us(end_time)
+
+    @property
+    def start_time(self):
+        return from_epoch_us(self._start)
+
+    @property
+    def end_time(self):
+        return from_epoch_us(self._end)
+
+    def replace(self, **changes):
+        return Break(changes.get("start_time", self.start_time), changes.get("end_time", self.end_time))
+
+    def __eq__(self, other):
+        return isinstance(other, Break) and (self._start, self._end) == (other._start, other._end)
+
+    def __hash__(self):
+        return hash((self._start, self._end))
+
+    def __repr__(self):
+        return f"Break(start_time={self.start_time!r}, end_time={self.end_time!r})"
+
+
+class Session:
+    __slots__ = ("id", "_start", "_end", "_last", "_flags", "breaks")
+
+    def __init__(self, id, start_time, end_time=None, is_active=True, breaks=(),
+                 last_update=None, ended_by_refresh=False):
+        self.id = sys.intern(str(id))
+        self._start = to_epoch_us(start_time)
+        self._end = to_epoch_us(end_time)
+        self._last = to_epoch_us(last_update)
+        self._flags = (_ACTIVE if is_active else 0) | (_ENDED_BY_REFRESH if ended_by_refresh else 0)
+        self.breaks = tuple(breaks)
+
+    @property
+    def start_time(self):
+        return from_epoch_us(self._start)
+
+    @property
+    def end_time(self):
+        return from_epoch_us(self._end)
+
+    @property
+    def last_update(self):
+        return from_epoch_us(self._last)
+
+    @property
+    def is_active(self):
+        return bool(self._flags & _ACTIVE)
+
+    @property
+    def ended_by_refresh(self):
+        return bool(self._flags & _ENDED_BY_REFRESH)
+
+    def replace(self, **changes):
+        new = Session.__new__(Session)
+        new.id = sys.intern(str(changes["id"])) if "id" in changes else self.id
+        new._start = to_epoch_us(changes["start_time"]) if "start_time" in changes else self._start
+        new._end = to_epoch_us(changes["end_time"]) if "end_time" in changes else self._end
+        new._last = to_epoch_us(changes["last_update"]) if "last_update" in changes else self._last
+        new.breaks = tuple(changes["breaks"]) if "breaks" in changes else self.breaks
+        is_active = changes.get("is_active", self.is_active)
+        ended_by_refresh = changes.get("ended_by_refresh", self.ended_by_refresh)
+        new._flags = (_ACTIVE if is_active else 0) | (_ENDED_BY_REFRESH if ended_by_refresh else 0)
+        return new
+
+    @property
+    def open_break(self):
+        """The break still running (always the last one), or None."""
+        if self.breaks and self.breaks[-1]._end is None:
+            return self.breaks[-1]
+        return None
+
+    def worked_time(self, now):
+        """Time on the clock up to ``now`` (or the end), breaks excluded."""
+        end = self._end if self._end is not None else to_epoch_us(now)
+        worked = end - self._start
+        for b in self.breaks:
+            worked -= (b._end if b._end is not None else end) - b._start
+        return timedelta(microseconds=max(worked, 0))
+
+    def close_breaks(self, when):
+        """Copy with every open break ended at ``when``."""
+        if not any(b._end is None for b in self.breaks):
+            return self
+        return self.replace(breaks=tuple(
+            b.replace(end_time=when) if b._end is None else b for b in self.breaks
+        ))
+
+    def _key(self):
+        return (self.id, self._start, self._end, self._last, self._flags, self.breaks)
+
+    def __eq__(self, other):
+        return isinstance(other, Session) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return (
+            f"Session(id={self.id!r}, start_time={self.start_time!r}, end_time={self.end_time!r}, "
+            f"is_active={self.is_active!r}, breaks={self.breaks!r}, "
+            f"last_update={self.last_update!r}, ended_by_refresh={self.ended_by_refresh!r})"
+        )
+
+
+# -------------------------------------------------------------
+# Plain-data form (journal / snapshot files)
+# -------------------------------------------------------------
+
+
+def pack_session(s):
+    """JSON-safe list holding exactly the record's fields."""
+    return [s.id, s._start, s._end, s._last, s._flags, [[b._start, b._end] for b in s.breaks]]
+
+
+def unpack_session(data):
+    sid, start, end, last, flags, breaks = data
+    s = Session.__new__(Session)
+    s.id = sys.intern(str(sid))
+    s._start, s._end, s._last, s._flags = start, end, last, flags
+    s.breaks = tuple(_unpack_break(b) for b in breaks)
+    return s
+
+
+def _unpack_break(data):
+    b = Break.__new__(Break)
+    b._start, b._end = data
+    return b
+
+
+# Column form for snapshots: every session's integers in one array('q'), every
+# break's in another, so a large store pickles and loads as a few byte blobs.
+_NULL = -(2 ** 63)
+_COLS = 5  # start, end, last_update, flags, break count
+
+
+def dump_columns(by_user):
+    """{user_id: (Session, ...)} → dict of plain columns (see load_columns)."""
+    uids, counts, ids = [], array("q"), []
+    cols, breaks = array("q"), array("q")
+    for uid, sessions in by_user.items():
+        uids.append(uid)
+        counts.append(len(sessions))
+        for s in sessions:
+            ids.append(s.id)
+            cols.extend((s._start, _NULL if s._end is None else s._end,
+                         _NULL if s._last is None else s._last, s._flags, len(s.breaks)))
+            for b in s.breaks:
+                breaks.append(b._start)
+                breaks.append(_NULL if b._end is None else b._end)
+    return {"uids": uids, "counts": counts, "ids": ids, "cols": cols, "breaks": breaks}
+
+
+def load_columns(data):
+    """Yield (user_id, [Session, ...]) from dump_columns() output."""
+    it = iter(data["cols"].tolist())
+    rows = zip(data["ids"], *([it] * _COLS))
+    it = iter(data["breaks"].tolist())
+    break_rows = zip(it, it)
+    for uid, n in zip(data["uids"], data["counts"]):
+        sessions = []
+        for sid, start, end, last, flags, nb in islice(rows, n):
+            s = Session.__new__(Session)
+            s.id = sid
+            s._start = start
+            s._end = None if end == _NULL else end
+            s._last = None if last == _NULL else last
+            s._flags = flags
+            breaks = []
+            for b_start, b_end in islice(break_rows, nb):
+                b = Break.__new__(Break)
+                b._start = b_start
+                b._end = None if b_end == _NULL else b_end
+                breaks.append(b)
+            s.breaks = tuple(breaks)
+            sessions.append(s)
+        yield uid, sessions
@@ -0,0 +1,57 @@
+# attendance/signals.py
+# User-table version counter.
+#
+# Every save / delete of a User bumps a counter kept in the TableVersion row
+# named USER_VERSION_KEY; views that render user lists derive their ETag from
+# it, so clients can revalidate with If-None-Match and get a 304 while
+# nothing changed. The row lives in the database, so every worker sees the
+# same version and a change made through one worker invalidates them all.
+
+import time
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import TableVersion
+
+USER_VERSION_KEY = "auth_user"
+
+
+def _seed():
+    # the first counter begins at the current time in ms, so it never hands
+    # out a version a client saw before the row was (re)created
+    try:
+        with transaction.atomic():
+            TableVersion.objects.create(name=USER_VERSION_KEY, version=time.time_ns() // 1_000_000)
+    except IntegrityError:
+        pass  # another worker seeded it first
+
+
+def user_table_version():
+    version = TableVersion.objects.filter(name=USER_VERSION_KEY).values_list("version", flat=True).first()
+    if version is None:
+        _seed()
+        version = TableVersion.objects.get(name=USER_VERSION_KEY).version
+    return version
+
+
+def bump_user_table_version():
+    # one UPDATE ... SET version = version + 1: concurrent bumps never collapse
+    if not TableVersion.objects.filter(name=USER_VERSION_KEY).update(version=F("version") + 1):
+        _seed()
+
+
+@receiver(post_save, sender=User)
+def _user_saved(sender, instance, update_fields=None, **kwargs):
+    # logins only touch last_login, which no list shows
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        return
+    bump_user_table_version()
+
+
+@receiver(post_delete, sender=User)
+def _user_deleted(sender, instance, **kwargs):
+    bump_user_table_version()
@@ -0,0 +1,222 @@
+# attendance/snapshots.py
+# Warm restart for the in-memory store.
+#
+# SnapshotSessionStore is MemorySessionStore plus two files under
+# ATTENDANCE_SNAPSHOT_DIR:
+#
+#   <seq>.snapshot   the whole store in column form, pickled, written every
+#                    ATTENDANCE_SNAPSHOT_INTERVAL seconds and at exit
+#   <seq>.log        every change since then, one JSON line each (the same
+#                    format as the write-behind journal)
+#
+# A snapshot numbered N holds everything logged before segment N. On start
+# the store loads the newest snapshot, replays the segments from N on and
+# writes a fresh snapshot, so a recycled worker comes back with everyone who
+# was clocked in. Like MemorySessionStore it is meant for a single worker.
+
+import atexit
+import gc
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from .records import dump_columns, load_columns
+from .store import MemorySessionStore, all_user_locks, user_lock
+from .writebehind import _FLUSH, _PUT, _encode_op, read_segment
+
+logger = logging.getLogger("attendance")
+
+
+def _seq(path):
+    return int(path.stem)
+
+
+class MutationLog:
+    """Append-only change log split in numbered segments."""
+
+    def __init__(self, directory, fsync=False):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._seq = max((_seq(p) for p in self.directory.glob("*.*")
+                         if p.suffix in (".log", ".snapshot")), default=0)
+        self._file = None
+        self.appended = 0
+
+    def segments(self):
+        return sorted(self.directory.glob("*.log"), key=_seq)
+
+    def append(self, op, uid, sess=None):
+        line = _encode_op(op, str(uid), sess)
+        with self._lock:
+            if self._file is None:
+                self._open(self._seq + 1)
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.appended += 1
+
+    def _open(self, seq):
+        self._seq = seq
+        self._file = open(self.directory / f"{seq:012d}.log", "a", encoding="utf-8")
+
+    def rotate(self):
+        """Close the current segment and start the next one; returns its number."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._seq += 1
+            # reserve the number even if nothing is logged before the next rotation
+            self._open(self._seq)
+            return self._seq
+
+
+def _write_atomic(path, data):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class SnapshotSessionStore(MemorySessionStore):
+    """MemorySessionStore that survives restarts through snapshots + a change log."""
+
+    def __init__(self):
+        self.directory = Path(getattr(
+            settings, "ATTENDANCE_SNAPSHOT_DIR", Path(settings.BASE_DIR) / "store_snapshots"
+        ))
+        self.log = MutationLog(self.directory, fsync=getattr(settings, "ATTENDANCE_JOURNAL_FSYNC", False))
+        self._snapshot_lock = threading.Lock()
+        self._snapshotted_at = 0  # log.appended at the last snapshot
+
+        started = time.perf_counter()
+        sessions, replayed = self.restore()
+        if sessions or replayed:
+            logger.info("Restored %d session(s) and replayed %d change(s) in %.0f ms",
+                        sessions, replayed, (time.perf_counter() - started) * 1000)
+        if replayed:
+            # fold the replayed log into a snapshot so the next start skips it
+            self.save_snapshot(force=True)
+
+        interval = getattr(settings, "ATTENDANCE_SNAPSHOT_INTERVAL", 300.0)
+        if interval > 0:
+            threading.Thread(target=self._run, args=(interval,), name="attendance-snapshot", daemon=True).start()
+        atexit.register(self.save_snapshot)
+
+    @property
+    def blocking(self):
+        # a change is one buffered write, fine on the event loop; with
+        # ATTENDANCE_JOURNAL_FSYNC every change waits for the disk
+        return self.log.fsync
+
+    # ---- changes are logged under the user's lock, before memory is updated ----
+
+    def add_session(self, user_id, sess):
+        with user_lock(user_id):
+            self.log.append(_PUT, user_id, sess)
+            return super().add_session(user_id, sess)
+
+    def save_session(self, user_id, sess):
+        with user_lock(user_id):
+            self.log.append(_PUT, user_id, sess)
+            return super().save_session(user_id, sess)
+
+    def flush_user(self, user_id):
+        with user_lock(user_id):
+            self.log.append(_FLUSH, user_id)
+            super().flush_user(user_id)
+
+    def drop_user(self, user_id):
+        with user_lock(user_id):
+            self.log.append(_FLUSH, user_id)
+            super().drop_user(user_id)
+
+    # ---- snapshots ----
+
+    def _latest_snapshot(self):
+        snaps = sorted(self.directory.glob("*.snapshot"), key=_seq)
+        return snaps[-1] if snaps else None
+
+    def restore(self):
+        """Load the newest snapshot and replay the log after it; returns (sessions, changes)."""
+        sessions = replayed = 0
+        start = 0
+        # nothing built here is garbage; collections while loading only cost time
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            path = self._latest_snapshot()
+            if path is not None:
+                with open(path, "rb") as f:
+                    data = pickle.load(f)
+                start = data["seq"]
+                for uid, user_sessions in load_columns(data["users"]):
+                    self.load_user(uid, user_sessions)
+                    sessions += len(user_sessions)
+
+            for segment in self.log.segments():
+                if _seq(segment) < start:
+                    continue
+                for op, uid, sess in read_segment(segment):
+                    self._replay(op, uid, sess)
+                    replayed += 1
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        return sessions, replayed
+
+    def _replay(self, op, uid, sess):
+        if op == _FLUSH:
+            MemorySessionStore.flush_user(self, uid)
+        elif sess.id in self.get_user_store(uid)["pos"]:
+            MemorySessionStore.save_session(self, uid, sess)
+        else:
+            MemorySessionStore.add_session(self, uid, sess)
+
+    def save_snapshot(self, force=False):
+        """Write a snapshot (if anything changed since the last one) and drop what it replaces."""
+        with self._snapshot_lock:
+            if not force and self.log.appended == self._snapshotted_at:
+                return None
+            # a consistent cut: every change is either in the old segments and
+            # in memory, or in neither yet
+            with all_user_locks():
+                seq = self.log.rotate()
+                appended = self.log.appended
+                users = {uid: entry["sessions"] for uid, entry in self.snapshot().items()}
+
+            data = pickle.dumps({"seq": seq, "users": dump_columns(users)}, protocol=pickle.HIGHEST_PROTOCOL)
+            path = self.directory / f"{seq:012d}.snapshot"
+            _write_atomic(path, data)
+            self._snapshotted_at = appended
+
+            for old in self.directory.glob("*.*"):
+                if old.suffix in (".log", ".snapshot") and _seq(old) < seq:
+                    old.unlink()
+            return path
+
+    def _run(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.save_snapshot()
+            except Exception:
+                logger.exception("Writing the store snapshot failed")
@@ -0,0 +1,75 @@
+# attendance/sqlite.py
+# SQLite performance profile.
+#
+# Every new SQLite connection gets the pragmas in
+# settings.ATTENDANCE_SQLITE_PRAGMAS (WAL, synchronous=NORMAL, mmap and page
+# cache by default), applied from the connection_created signal. WAL lets
+# readers carry on while one worker writes. How long a writer waits for the
+# lock is DATABASES["default"]["OPTIONS"]["timeout"] (sqlite3 turns it into
+# SQLite's busy timeout), so it is not repeated here.
+#
+# retry_on_locked() wraps the store's write paths: a write that still finds
+# the database locked after that timeout is retried a few times with a short
+# backoff before the error reaches the view.
+
+import functools
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger("attendance")
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 64 * 1024 * 1024,
+    "cache_size": -16000,  # KiB (negative = size, not pages)
+    "temp_store": "MEMORY",
+}
+
+
+def _pragmas():
+    pragmas = getattr(settings, "ATTENDANCE_SQLITE_PRAGMAS", None)
+    return DEFAULT_PRAGMAS if pragmas is None else pragmas
+
+
+@receiver(connection_created)
+def _apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in _pragmas().items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def _is_locked(exc):
+    msg = str(exc).lower()
+    return "database is locked" in msg or "database is busy" in msg
+
+
+def retry_on_locked(fn):
+    """Retry ``fn`` when SQLite reports the database locked (outside any atomic block)."""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        retries = getattr(settings, "ATTENDANCE_SQLITE_WRITE_RETRIES", 3)
+        delay = getattr(settings, "ATTENDANCE_SQLITE_RETRY_DELAY", 0.05)
+        attempt = 0
+        while True:
+            try:
+                return fn(*args, **kwargs)
+            except OperationalError as exc:
+                # inside an outer transaction the caller owns the rollback; retrying
+                # here would repeat only half of its work
+                if attempt >= retries or not _is_locked(exc) or connection.in_atomic_block:
+                    raise
+                attempt += 1
+                logger.warning("Database locked in %s, retry %d/%d", fn.__qualname__, attempt, retries)
+                time.sleep(delay * (2 ** (attempt - 1)) * (0.5 + random.random()))
+
+    return wrapper
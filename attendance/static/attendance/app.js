@@ -12,35 +12,6 @@
 const API_BASE = 'https://attendance-0gu9.onrender.com/api/'; // prod
 const tokenKey = 'att_access_token';
 
-// ===== styles =====
-(function injectStyles(){
-  const css = `
-    .danger-btn { background-color:#d9534f;color:white;border:none;padding:6px 10px;border-radius:4px;cursor:pointer;margin-left:6px; }
-    .danger-btn:hover { background-color:#c9302c; }
-    .secondary { margin-left:8px; }
-
-    #tracking-backdrop { position:fixed; inset:0; background:rgba(0,0,0,0.45); display:flex; align-items:center; justify-content:center; opacity:0; transition:.18s; z-index:9999; }
-    #tracking-backdrop.show { opacity:1; }
-    .tracking-modal { background:white; border-radius:8px; box-shadow:0 6px 24px rgba(0,0,0,.25); width:600px; max-height:90vh; overflow:auto; }
-    .tracking-btn { padding:6px 8px; border-radius:4px; border:1px solid #ddd; background:#f0f0f0; cursor:pointer; }
-    .tracking-btn.primary { background:#007bff;color:white;border-color:#007bff; }
-    .small-note { color:#666; font-size:12px; }
-    /* logout-indicator */
-    #logout-indicator-wrapper { padding:8px 10px; border-radius:6px; background:#f7f7f7; margin-bottom:10px; border:1px solid #eee; }
-    #logout-indicator .dot { display:inline-block; width:10px; height:10px; background:#28a745; border-radius:50%; margin-right:8px; vertical-align:middle; }
-
-    /* basic cards/tables for layout */
-    .card { background:white;border-radius:8px;padding:12px;margin-bottom:12px;border:1px solid #eee;box-shadow:0 1px 4px rgba(0,0,0,0.03); }
-    .row { margin-bottom:8px; }
-    .table { width:100%; border-collapse:collapse; }
-    .table th, .table td { padding:8px; border-bottom:1px solid #f0f0f0; }
-    .actions button { margin-right:6px; }
-  `;
-  const s = document.createElement('style');
-  s.appendChild(document.createTextNode(css));
-  document.head.appendChild(s);
-})();
-
 // ===== utilities =====
 function el(id){ return document.getElementById(id); }
 function qs(sel, parent=document){ return parent.querySelector(sel); }
@@ -109,6 +80,58 @@ function downloadBlob(blob, filename){
   setTimeout(()=>URL.revokeObjectURL(url), 1000);
 }
 
+// ===== live events (Server-Sent Events) =====
+// events/ pushes start / break / end / revive as they happen, so views update
+// without polling. It is only served under ASGI: events/token/ says whether it
+// is ("live") and grants a short-lived stream token for the URL, since
+// EventSource cannot send headers and the access token must stay out of URLs.
+const LIVE_EVENT_TYPES = ['start','restore','break_start','break_end','refresh_end','end','revive'];
+let liveEvents = null;
+let liveEventsScope = null;   // set while the stream is open or being opened
+let liveEventsHandler = null;
+let liveEventsServed = true;  // false once the server says there is no stream
+let liveEventsGeneration = 0; // bumped on close, so a pending open gives up
+
+function closeLiveEvents(){
+  liveEventsGeneration++;
+  if(liveEvents){ liveEvents.close(); }
+  liveEvents = null; liveEventsScope = null; liveEventsHandler = null;
+}
+
+async function openLiveEvents(scope, onEvent){
+  if(liveEventsScope === scope) { liveEventsHandler = onEvent; return; }
+  closeLiveEvents();
+  if(!liveEventsServed || !getToken() || !window.EventSource) return;
+  const generation = liveEventsGeneration;
+  liveEventsScope = scope; liveEventsHandler = onEvent;
+
+  let grant = null;
+  try { grant = await apiFetch('attendance/events/token/', { method: 'POST' }); }
+  catch(e){ console.warn('live events unavailable', e); }
+  if(generation !== liveEventsGeneration) return;
+  if(!grant || !grant.live){
+    if(grant) liveEventsServed = false;
+    liveEventsScope = null;
+    return;
+  }
+
+  const params = new URLSearchParams({ token: grant.token });
+  if(scope === 'all') params.set('scope', 'all');
+  const source = new EventSource(API_BASE + 'attendance/events/?' + params.toString());
+  const handler = (ev)=>{ try{ liveEventsHandler(JSON.parse(ev.data)); }catch(e){ console.warn('live event failed', e); } };
+  for(const type of LIVE_EVENT_TYPES) source.addEventListener(type, handler);
+  // the browser reconnects with the same URL by itself; once the token has
+  // expired that fails for good, so start over with a fresh one
+  source.onerror = ()=>{
+    if(source !== liveEvents || source.readyState !== EventSource.CLOSED) return;
+    const retryHandler = liveEventsHandler;
+    closeLiveEvents();
+    const retryGeneration = liveEventsGeneration;
+    setTimeout(()=>{ if(retryGeneration === liveEventsGeneration) openLiveEvents(scope, retryHandler); }, 3000);
+  };
+  liveEvents = source;
+}
+
 // ===== navigation & rendering =====
 window.addEventListener('hashchange', render);
 window.addEventListener('load', render);
@@ -184,6 +207,7 @@ async function render(){
 // ===== Login UI =====
 function renderLogin(){
   if(!el('main')) { console.error('renderLogin: #main missing'); return; }
+  closeLiveEvents();
   el('main').innerHTML = `
     <div class="card">
       <h3>Sign In</h3>
@@ -230,9 +254,11 @@ function renderLogin(){
 }
 
 // ===== Dashboard =====
+let lastDashboardRender = 0;
 async function renderDashboard(){
   if(!el('main')) { console.error('#main not found'); return; }
   if(!isLogged()) return navigateTo('#login');
+  lastDashboardRender = Date.now();
 
   el('main').innerHTML = `<div class="card"><h3>Dashboard</h3><div id="dash-content">Loading...</div></div>`;
 
@@ -309,6 +335,11 @@ async function renderDashboard(){
     // logout indicator UI
     setLogoutIndicator(!!active);
 
+    // changes made elsewhere (another tab, a beacon) re-render; our own clicks already do
+    openLiveEvents('self', ()=>{
+      if(location.hash === '#dashboard' && Date.now() - lastDashboardRender > 1000) renderDashboard();
+    });
+
   } catch(err){
     console.error('renderDashboard error', err);
     if(err && err.status === 401){
@@ -330,10 +361,30 @@ async function renderAdmin(){
     const me = await apiFetch('attendance/auth/me/');
     if(!me.is_staff) { el('admin-body').innerHTML = 'Access denied'; return; }
 
-    const res = await apiFetch('attendance/employees/');
-    const employees = res.employees || [];
+    // employees/ is paginated by id: follow `next` until the last page
+    const employees = [];
+    let after = 0;
+    while(after !== null){
+      const res = await apiFetch(`attendance/employees/?after=${after}`);
+      employees.push(...(res.employees || []));
+      after = res.next ?? null;
+    }
 
-    let tableHtml = `<div class="card" style="margin-bottom:12px"><h4>Employees</h4><table class="table" style="width:100%;border-collapse:collapse"><thead><tr style="text-align:left"><th>id</th><th>username</th><th>name</th><th>email</th><th>admin?</th><th>actions</th></tr></thead><tbody>`;
+    // live status for everyone in one call
+    const statusById = {};
+    try{
+      const st = await apiFetch('attendance/employees/status/');
+      for(const r of (st.employees || [])) statusById[r.id] = r;
+    }catch(err){ console.warn('employees/status failed', err); }
+    const workedMinutes = (s) => {
+      const now = Date.now(); const end = s.end_time ? new Date(s.end_time) : now;
+      let ms = end - new Date(s.start_time);
+      for(const b of (s.breaks || [])) ms -= (b.end_time ? new Date(b.end_time) : end) - new Date(b.start_time);
+      return Math.max(0, Math.floor(ms / 60000));
+    };
+    const statusText = (r) => !r ? '—' : (!r.clocked_in ? 'Off' : `${r.on_break ? 'On break' : 'Working'} (${Math.floor(r.worked_minutes/60)}h ${r.worked_minutes%60}m)`);
+
+    let tableHtml = `<div class="card" style="margin-bottom:12px"><h4>Employees</h4><table class="table" style="width:100%;border-collapse:collapse"><thead><tr style="text-align:left"><th>id</th><th>username</th><th>name</th><th>email</th><th>admin?</th><th>status</th><th>actions</th></tr></thead><tbody>`;
     for(const u of employees){
       let actions = `<button class="view-tracking">View</button>`;
       if(u.id !== me.id) actions += `<button class="promote">${u.is_staff? 'Demote':'Promote'}</button>`;
@@ -341,7 +392,7 @@ async function renderAdmin(){
         actions += `<button class="flush-user danger-btn">Flush</button>`;
         actions += `<button class="delete-user danger-btn">Delete</button>`;
       }
-      tableHtml += `<tr data-id="${u.id}" style="border-top:1px solid #eee"><td style="padding:8px">${u.id}</td><td style="padding:8px">${escapeHtml(u.username)}</td><td style="padding:8px">${escapeHtml(u.first_name + ' ' + u.last_name)}</td><td style="padding:8px">${escapeHtml(u.email || '')}</td><td style="padding:8px">${u.is_staff? 'Yes' : 'No'}</td><td style="padding:8px"><div class="actions">${actions}</div></td></tr>`;
+      tableHtml += `<tr data-id="${u.id}" style="border-top:1px solid #eee"><td style="padding:8px">${u.id}</td><td style="padding:8px">${escapeHtml(u.username)}</td><td style="padding:8px">${escapeHtml(u.first_name + ' ' + u.last_name)}</td><td style="padding:8px">${escapeHtml(u.email || '')}</td><td style="padding:8px">${u.is_staff? 'Yes' : 'No'}</td><td class="status-cell" style="padding:8px">${statusText(statusById[u.id])}</td><td style="padding:8px"><div class="actions">${actions}</div></td></tr>`;
     }
     tableHtml += `</tbody></table></div>`;
 
@@ -355,6 +406,15 @@ async function renderAdmin(){
 
     el('admin-body').innerHTML = tableHtml;
 
+    // keep the status column live
+    openLiveEvents('all', (ev)=>{
+      const cell = document.querySelector(`tr[data-id="${ev.user_id}"] .status-cell`);
+      const sess = ev.session;
+      if(!cell || !sess) return;
+      const onBreak = (sess.breaks || []).some(b => !b.end_time);
+      cell.textContent = statusText({ clocked_in: sess.is_active, on_break: onBreak, worked_minutes: workedMinutes(sess) });
+    });
+
     // Create User modal markup (hidden initially)
     const modalHtml = `
       <div id="create-user-modal" style="position:fixed;inset:0;display:none;align-items:center;justify-content:center;z-index:10000;">
@@ -632,7 +692,8 @@ async function showTrackingPopup(empId){
   backdrop.addEventListener('click', (ev)=>{ if(ev.target === backdrop) backdrop.remove(); });
 
   try{
-    const res = await apiFetch(`attendance/employees/${empId}/tracking/`);
+    // only the latest session is shown
+    const res = await apiFetch(`attendance/employees/${empId}/tracking/?limit=1`);
     const sessions = Array.isArray(res.sessions) ? res.sessions : [];
     if(sessions.length === 0){ el('track-content').innerHTML = '<div class="small-note">No sessions</div>'; return; }
 
@@ -0,0 +1,70 @@
+# attendance/storage.py
+# Static files storage for collectstatic.
+#
+# On top of WhiteNoise's CompressedManifestStaticFilesStorage (content-hashed
+# names, gzip + brotli variants, served with far-future immutable caching)
+# the dashboard's own CSS / JS is minified before it is hashed. Minifying
+# needs rcssmin / rjsmin; without them the files are collected unminified.
+
+import logging
+
+from django.core.files.base import ContentFile
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+logger = logging.getLogger("attendance")
+
+# only our assets: admin / rest_framework ship their own (partly minified) files
+MINIFY_PREFIXES = ("attendance/",)
+
+
+def _minifiers():
+    minifiers = {}
+    try:
+        from rcssmin import cssmin
+        minifiers[".css"] = cssmin
+    except ImportError:
+        logger.warning("rcssmin not installed, CSS is collected unminified")
+    try:
+        from rjsmin import jsmin
+        minifiers[".js"] = jsmin
+    except ImportError:
+        logger.warning("rjsmin not installed, JS is collected unminified")
+    return minifiers
+
+
+class MinifiedStaticFilesStorage(CompressedManifestStaticFilesStorage):
+    # a file missing from the manifest is looked up (and hashed) in STATIC_ROOT
+    manifest_strict = False
+
+    def stored_name(self, name):
+        # before the first collectstatic it is not there either: keep serving
+        # the plain name instead of failing every {% static %} tag
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            paths = self._minify(paths)
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+
+    def _minify(self, paths):
+        """Minify the collected copies in place; the hashing then reads those instead of the sources."""
+        minifiers = _minifiers()
+        paths = dict(paths)
+        for path in list(paths):
+            if not path.startswith(MINIFY_PREFIXES):
+                continue
+            minify = minifiers.get(path[path.rfind("."):])
+            if minify is None:
+                continue
+            with self.open(path) as f:
+                source = f.read().decode("utf-8")
+            minified = minify(source)
+            if len(minified) < len(source):
+                self.delete(path)
+                self._save(path, ContentFile(minified.encode("utf-8")))
+            # an unmodified file was minified by an earlier run
+            paths[path] = (self, path)
+        return paths
@@ -0,0 +1,475 @@
+# attendance/store.py
+# Pluggable session store used by the attendance views.
+#
+# MemorySessionStore keeps everything in the per-process ATTENDANCE_STORE
+# dict (the original behaviour). DatabaseSessionStore persists every
+# session on the Attendance / BreakInterval models so several workers can
+# share state and a restart does not lose open sessions; it reads the
+# database every time and keeps nothing in the dict.
+#
+# Sessions are immutable records (see records.py) held in per-user lists.
+# A list only grows at the end; a change replaces one item with a new
+# record, so it costs the same however long the user's history is, and
+# readers index or slice the list without locking it.
+#
+# Pick the backend with settings.ATTENDANCE_SESSION_STORE (dotted path).
+
+import threading
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Prefetch
+from django.utils.module_loading import import_string
+
+from .models import Attendance, BreakInterval
+from .records import Break, Session, from_epoch_us, to_epoch_us
+from .sqlite import retry_on_locked
+
+# -------------------------------------------------------------
+# GLOBALS
+# -------------------------------------------------------------
+
+# STORE_LOCK only guards the top-level dict (adding / replacing / removing a
+# user's entry). Anything that changes one user's sessions holds that user's
+# stripe lock instead, so unrelated users never wait on each other.
+STORE_LOCK = threading.RLock()
+ATTENDANCE_STORE = {}  # user_id → entry, see _new_entry()
+
+# Secondary index filled at session start: start date → {user_id: [position, ...]}
+# (positions in that user's session list), so a day export only touches that
+# day's sessions. Guarded by STORE_LOCK.
+DATE_INDEX = {}
+
+# user_id → that user's active session, kept current by every write so the
+# admin roster never walks anyone's history. Guarded by STORE_LOCK.
+ROSTER = {}
+
+LOCK_STRIPES = getattr(settings, "ATTENDANCE_LOCK_STRIPES", 64)
+_USER_LOCKS = [threading.RLock() for _ in range(LOCK_STRIPES)]
+
+DEFAULT_SESSION_STORE = "attendance.store.MemorySessionStore"
+
+
+def user_lock(user_id):
+    """Re-entrant lock for one user's sessions (striped, so shared by a few users)."""
+    return _USER_LOCKS[hash(str(user_id)) % LOCK_STRIPES]
+
+
+@contextmanager
+def all_user_locks():
+    """Hold every stripe: no user's sessions change until the block exits."""
+    with ExitStack() as stack:
+        for lock in _USER_LOCKS:
+            stack.enter_context(lock)
+        yield
+
+
+# -------------------------------------------------------------
+# Per-user entry helpers
+# -------------------------------------------------------------
+#
+# An entry is
+#   {"sessions": [Session, ...],   oldest first, appended to / item replaced
+#    "pos": {session_id: index},
+#    "active": Session | None,     pointers so the hot paths never scan
+#    "last": Session | None,
+#    "dates": set()}               DATE_INDEX buckets the user appears in
+# Writers hold the user's lock; readers index or copy "sessions" and never
+# change it.
+
+
+_US_PER_DAY = 86_400_000_000
+
+
+@lru_cache(maxsize=4096)
+def _utc_date(day):
+    return from_epoch_us(day * _US_PER_DAY).date()
+
+
+def _session_date(sess):
+    # same day boundary the CSV export has always used (UTC date of the stored datetime)
+    return _utc_date(sess._start // _US_PER_DAY)
+
+
+def _new_entry(sessions=()):
+    sessions = list(sessions)
+    entry = {
+        "sessions": sessions,
+        "pos": {s.id: i for i, s in enumerate(sessions)},
+        "active": None,
+        "last": sessions[-1] if sessions else None,
+        "dates": set(),
+    }
+    for s in reversed(sessions):
+        if s.is_active:
+            entry["active"] = s
+            break
+    return entry
+
+
+def _track(entry, sess):
+    """Update the pointers after ``sess`` was added or changed."""
+    if sess.is_active:
+        entry["active"] = sess
+    elif entry["active"] is not None and entry["active"].id == sess.id:
+        entry["active"] = None
+    if entry["last"] is None or entry["last"].id == sess.id:
+        entry["last"] = sess
+
+
+def _put(entry, sess):
+    """Put ``sess`` in the entry (append if it is new, else replace it); returns its position."""
+    sessions = entry["sessions"]
+    i = entry["pos"].get(sess.id)
+    if i is None:
+        i = len(sessions)
+        sessions.append(sess)
+        entry["pos"][sess.id] = i
+        entry["last"] = sess
+    else:
+        sessions[i] = sess
+    _track(entry, sess)
+    return i
+
+
+def _update_roster(uid, entry):
+    """Mirror the entry's active pointer into ROSTER (caller holds STORE_LOCK)."""
+    if entry["active"] is not None:
+        ROSTER[uid] = entry["active"]
+    else:
+        ROSTER.pop(uid, None)
+
+
+def _start_us(sess):
+    return sess._start
+
+
+def _index_date(uid, entry, i, sess):
+    """Add position ``i`` of ``sess`` to DATE_INDEX (caller holds STORE_LOCK)."""
+    date = _session_date(sess)
+    DATE_INDEX.setdefault(date, {}).setdefault(uid, []).append(i)
+    entry["dates"].add(date)
+
+
+def _unindex_dates(uid, entry):
+    """Remove every DATE_INDEX reference to one user (caller holds STORE_LOCK)."""
+    for date in entry["dates"]:
+        bucket = DATE_INDEX.get(date)
+        if bucket is not None:
+            bucket.pop(uid, None)
+            if not bucket:
+                del DATE_INDEX[date]
+    entry["dates"] = set()
+
+
+# -------------------------------------------------------------
+# In-memory backend
+# -------------------------------------------------------------
+
+
+class MemorySessionStore:
+    """Sessions live only in ATTENDANCE_STORE (lost on restart)."""
+
+    # no I/O: async views may call it straight from the event loop
+    blocking = False
+
+    def get_user_store(self, user_id):
+        uid = str(user_id)
+        with STORE_LOCK:
+            if uid not in ATTENDANCE_STORE:
+                ATTENDANCE_STORE[uid] = _new_entry()
+            return ATTENDANCE_STORE[uid]
+
+    def user_transaction(self, user_id):
+        """Context for a read-then-write on one user's sessions (e.g. "start unless active")."""
+        return user_lock(user_id)
+
+    def active_session(self, user_id):
+        return self.get_user_store(user_id)["active"]
+
+    def last_session(self, user_id):
+        return self.get_user_store(user_id)["last"]
+
+    def add_session(self, user_id, sess):
+        """Store a new session; returns the record as stored."""
+        with user_lock(user_id):
+            entry = self.get_user_store(user_id)
+            i = _put(entry, sess)
+            with STORE_LOCK:
+                _index_date(str(user_id), entry, i, sess)
+                _update_roster(str(user_id), entry)
+        return sess
+
+    def save_session(self, user_id, sess):
+        """Replace the stored session with the same id by ``sess``; returns it."""
+        with user_lock(user_id):
+            entry = self.get_user_store(user_id)
+            _put(entry, sess)
+            with STORE_LOCK:
+                _update_roster(str(user_id), entry)
+        return sess
+
+    def flush_user(self, user_id):
+        uid = str(user_id)
+        with user_lock(user_id), STORE_LOCK:
+            if uid in ATTENDANCE_STORE:
+                _unindex_dates(uid, ATTENDANCE_STORE[uid])
+            ATTENDANCE_STORE[uid] = _new_entry()
+            ROSTER.pop(uid, None)
+
+    def drop_user(self, user_id):
+        uid = str(user_id)
+        with user_lock(user_id), STORE_LOCK:
+            entry = ATTENDANCE_STORE.pop(uid, None)
+            if entry is not None:
+                _unindex_dates(uid, entry)
+            ROSTER.pop(uid, None)
+
+    def load_user(self, user_id, sessions):
+        """Replace one user's sessions wholesale (oldest first), e.g. when loading from disk."""
+        uid = str(user_id)
+        entry = _new_entry(sessions)
+        with user_lock(user_id), STORE_LOCK:
+            old = ATTENDANCE_STORE.get(uid)
+            if old is not None:
+                _unindex_dates(uid, old)
+            ATTENDANCE_STORE[uid] = entry
+            for i, s in enumerate(entry["sessions"]):
+                _index_date(uid, entry, i, s)
+            _update_roster(uid, entry)
+
+    def _sessions(self, user_id):
+        # the live list: index or slice it, never change it
+        with STORE_LOCK:
+            entry = ATTENDANCE_STORE.get(str(user_id))
+        return entry["sessions"] if entry is not None else []
+
+    def user_sessions(self, user_id):
+        """One user's sessions, oldest first (a tuple copy)."""
+        return tuple(self._sessions(user_id))
+
+    def sessions_between(self, user_id, since=None, until=None, limit=None):
+        """
+        One user's sessions started in [since, until), oldest first.
+
+        With ``limit`` only the newest ``limit`` of them. The list is in start
+        order, so the window is found by bisection and only it is copied.
+        """
+        sessions = self._sessions(user_id)
+        lo = bisect_left(sessions, to_epoch_us(since), key=_start_us) if since else 0
+        hi = bisect_left(sessions, to_epoch_us(until), key=_start_us) if until else len(sessions)
+        if limit is not None:
+            lo = max(lo, hi - limit)
+        return tuple(sessions[lo:hi])
+
+    def sessions_for_date(self, date):
+        """Sessions started on ``date``: {user_id: [sess, ...]}."""
+        # add_session appends to the list before it indexes the new
+        # position, so positions copied under the lock are all inside it
+        with STORE_LOCK:
+            bucket = [
+                (uid, ATTENDANCE_STORE[uid]["sessions"], tuple(positions))
+                for uid, positions in DATE_INDEX.get(date, {}).items()
+                if uid in ATTENDANCE_STORE
+            ]
+        return {uid: [sessions[i] for i in positions] for uid, sessions, positions in bucket}
+
+    def roster(self):
+        """Every active session: {user_id: sess}."""
+        with STORE_LOCK:
+            return dict(ROSTER)
+
+    def snapshot(self):
+        """The whole store as {user_id: {"sessions": (sess, ...)}}; only the lists are copied."""
+        with STORE_LOCK:
+            return {uid: {"sessions": tuple(entry["sessions"])} for uid, entry in ATTENDANCE_STORE.items()}
+
+
+# -------------------------------------------------------------
+# Database backend
+# -------------------------------------------------------------
+
+
+def _attendance_to_record(a):
+    return Session(
+        id=str(a.pk),
+        start_time=a.start_time,
+        end_time=a.end_time,
+        is_active=a.is_active,
+        breaks=tuple(Break(b.start_time, b.end_time) for b in a.breaks.all()),
+        last_update=a.last_update or a.start_time,
+        ended_by_refresh=a.ended_by_refresh,
+    )
+
+
+class DatabaseSessionStore:
+    """
+    Sessions are persisted on Attendance / BreakInterval.
+
+    Every read goes to the database so all workers see the same state.
+    """
+
+    # every call hits the database: async views run it in a worker thread
+    blocking = True
+
+    def _rows(self):
+        return Attendance.objects.prefetch_related(
+            Prefetch("breaks", queryset=BreakInterval.objects.order_by("start_time", "id"))
+        )
+
+    @contextmanager
+    def user_transaction(self, user_id):
+        # BEGIN IMMEDIATE (settings.DATABASES transaction_mode) takes the write
+        # lock up front, so the read and the write are serialized with every
+        # other worker, not only with this process's threads
+        with user_lock(user_id), transaction.atomic():
+            yield
+
+    def active_session(self, user_id):
+        a = (
+            self._rows()
+            .filter(user_id=user_id, is_active=True)
+            .order_by("-start_time", "-id")
+            .first()
+        )
+        return _attendance_to_record(a) if a else None
+
+    def last_session(self, user_id):
+        a = self._rows().filter(user_id=user_id).order_by("-start_time", "-id").first()
+        return _attendance_to_record(a) if a else None
+
+    @retry_on_locked
+    def add_session(self, user_id, sess):
+        a = Attendance.objects.create(
+            user_id=user_id,
+            start_time=sess.start_time,
+            end_time=sess.end_time,
+            is_active=sess.is_active,
+            last_update=sess.last_update,
+            ended_by_refresh=sess.ended_by_refresh,
+        )
+        return sess.replace(id=str(a.pk))
+
+    @retry_on_locked
+    def save_session(self, user_id, sess):
+        with transaction.atomic():
+            Attendance.objects.filter(pk=sess.id, user_id=user_id).update(
+                end_time=sess.end_time,
+                is_active=sess.is_active,
+                last_update=sess.last_update,
+                ended_by_refresh=sess.ended_by_refresh,
+            )
+
+            # breaks are append-only and ordered, so match them up by position
+            rows = list(BreakInterval.objects.filter(attendance_id=sess.id).order_by("start_time", "id"))
+            for row, b in zip(rows, sess.breaks):
+                if row.end_time != b.end_time:
+                    row.end_time = b.end_time
+                    row.is_active = b.end_time is None
+                    row.save(update_fields=["end_time", "is_active"])
+            BreakInterval.objects.bulk_create([
+                BreakInterval(
+                    attendance_id=sess.id,
+                    start_time=b.start_time,
+                    end_time=b.end_time,
+                    is_active=b.end_time is None,
+                )
+                for b in sess.breaks[len(rows):]
+            ])
+        return sess
+
+    @retry_on_locked
+    def flush_user(self, user_id):
+        Attendance.objects.filter(user_id=user_id).delete()
+
+    def drop_user(self, user_id):
+        # the rows go with the User (on_delete=CASCADE); nothing is held here
+        pass
+
+    def user_sessions(self, user_id):
+        return tuple(
+            _attendance_to_record(a)
+            for a in self._rows().filter(user_id=user_id).order_by("start_time", "id")
+        )
+
+    def sessions_between(self, user_id, since=None, until=None, limit=None):
+        rows = self._rows().filter(user_id=user_id)
+        if since:
+            rows = rows.filter(start_time__gte=since)
+        if until:
+            rows = rows.filter(start_time__lt=until)
+        if limit is None:
+            return tuple(_attendance_to_record(a) for a in rows.order_by("start_time", "id"))
+        newest = rows.order_by("-start_time", "-id")[:limit]
+        return tuple(reversed([_attendance_to_record(a) for a in newest]))
+
+    def sessions_for_date(self, date):
+        start = datetime.combine(date, time.min, tzinfo=dt_timezone.utc)
+        day = {}
+        rows = self._rows().filter(start_time__gte=start, start_time__lt=start + timedelta(days=1))
+        for a in rows.order_by("start_time", "id"):
+            day.setdefault(str(a.user_id), []).append(_attendance_to_record(a))
+        return day
+
+    def roster(self):
+        # other workers change sessions too, so ask the database; only the
+        # open sessions (and their breaks) are read
+        return {
+            str(a.user_id): _attendance_to_record(a)
+            for a in self._rows().filter(is_active=True).order_by("start_time", "id")
+        }
+
+    def snapshot(self):
+        snap = {}
+        for a in self._rows().order_by("start_time", "id"):
+            snap.setdefault(str(a.user_id), {"sessions": []})["sessions"].append(
+                _attendance_to_record(a)
+            )
+        return snap
+
+
+# -------------------------------------------------------------
+# Backend selection
+# -------------------------------------------------------------
+
+
+@lru_cache(maxsize=None)
+def get_session_store():
+    path = getattr(settings, "ATTENDANCE_SESSION_STORE", DEFAULT_SESSION_STORE)
+    return import_string(path)()
+
+
+def db_sync_to_async(fn):
+    """
+    sync_to_async(fn) on any pool thread, with Django's per-request connection handling.
+
+    Django closes stale or expired connections only on the request's own
+    thread; without this a pool thread would keep its connection for good,
+    whatever CONN_MAX_AGE says.
+    """
+    def call(*args):
+        close_old_connections()
+        try:
+            return fn(*args)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(call, thread_sensitive=False)
+
+
+async def aget_session_store():
+    """
+    get_session_store() for async views.
+
+    Building a store may read the database or replay files (write-behind,
+    snapshots), so the first call builds it in the sync thread rather than
+    on the event loop.
+    """
+    if get_session_store.cache_info().currsize:
+        return get_session_store()
+    return await sync_to_async(get_session_store)()
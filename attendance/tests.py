@@ -1,3 +1,1053 @@
-from django.test import TestCase
+import atexit
+import io
+import tempfile
+import threading
+import zoneinfo
+from unittest import mock
+from asgiref.sync import async_to_sync
+from pathlib import Path
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.template.loader import render_to_string
+from django.db import OperationalError, connection, transaction
+from django.db.models import F
+from django.urls import path
+from django.utils import timezone
+from django.test import (
+    AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+    skipUnlessDBFeature,
+)
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import authentication
+from .async_views import (
+    AsyncCurrentStatusView, AsyncEndAttendanceView, AsyncReviveAttendanceView,
+    AsyncStartAttendanceView, AsyncToggleBreakView,
+)
+from .authentication import CachedJWTAuthentication, authenticate_token, invalidate_cached_user
+from .models import Attendance, BreakInterval, TableVersion
+from .records import Break, Session
+from .events import issue_stream_token
+from .exports import (
+    _DAY_FILES, ExportQueue, _TimeFormatter, _encode, _record_rows, _save_csv_user_date, _session_row,
+    invalidate_csv_cache,
+)
+from .signals import USER_VERSION_KEY
+from .snapshots import SnapshotSessionStore
+from .store import (
+    ATTENDANCE_STORE, DatabaseSessionStore, MemorySessionStore, db_sync_to_async, get_session_store,
+)
+from .views import (
+    BEACON_MAX_BYTES, _beacon_body, _end_attendance, _revive_attendance, _start_attendance, _toggle_break,
+)
+from .writebehind import MAX_ATTEMPTS, WriteBehindJournal, apply_ops as real_apply_ops, read_segment
+
+
+@skipUnlessDBFeature("supports_explaining_query_execution")
+class QueryPlanTests(TestCase):
+    """The session store's hot lookups are served by the indexes from 0003_query_indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("planner")
+        cls.day = datetime(2025, 11, 25, tzinfo=dt_timezone.utc)
+        cls.attendance = Attendance.objects.create(user=cls.user, start_time=cls.day)
+        BreakInterval.objects.create(attendance=cls.attendance, start_time=cls.day)
+
+    def assertUsesIndex(self, qs, index):
+        plan = qs.explain()
+        if connection.vendor == "sqlite":
+            self.assertIn(f"USING INDEX {index}", plan)
+        else:
+            self.assertIn(index, plan)
+
+    def test_active_session_for_user(self):
+        qs = Attendance.objects.filter(user=self.user, is_active=True).order_by("-start_time", "-id")[:1]
+        self.assertUsesIndex(qs, "attendance_open_user_idx")
+
+    def test_roster(self):
+        qs = Attendance.objects.filter(is_active=True).order_by("start_time", "id")
+        self.assertUsesIndex(qs, "attendance_open_idx")
+
+    def test_user_history(self):
+        qs = Attendance.objects.filter(user=self.user, start_time__gte=self.day).order_by("-start_time", "-id")[:50]
+        self.assertUsesIndex(qs, "attendance_user_start_idx")
+
+    def test_sessions_for_date(self):
+        qs = Attendance.objects.filter(
+            start_time__gte=self.day, start_time__lt=self.day + timedelta(days=1)
+        ).order_by("start_time", "id")
+        self.assertUsesIndex(qs, "attendance_start_idx")
+
+    def test_breaks_for_attendance(self):
+        qs = BreakInterval.objects.filter(attendance=self.attendance).order_by("start_time", "id")
+        self.assertUsesIndex(qs, "break_attendance_start_idx")
+
+
+class WriteBehindJournalTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.user = User.objects.create_user("journaled")
+        self.t0 = datetime(2025, 11, 25, 9, tzinfo=dt_timezone.utc)
+
+    def test_replay_applies_newest_state(self):
+        journal = WriteBehindJournal(self.dir.name, delay=60)
+        sess = Session("9001", self.t0, last_update=self.t0)
+        journal.append("put", self.user.id, sess)
+        sess = sess.replace(breaks=(Break(self.t0 + timedelta(hours=1)),))
+        journal.append("put", self.user.id, sess)
+        sess = sess.close_breaks(self.t0 + timedelta(hours=2)).replace(
+            end_time=self.t0 + timedelta(hours=8), is_active=False,
+        )
+        journal.append("put", self.user.id, sess)
+
+        # a new process finds the segment and replays it
+        self.assertEqual(WriteBehindJournal(self.dir.name, delay=60).replay(), 3)
+        self.assertEqual(DatabaseSessionStore().user_sessions(self.user.id), (sess,))
+        self.assertEqual(WriteBehindJournal(self.dir.name, delay=60).segments(), [])
+
+    def test_flush_drops_earlier_changes(self):
+        journal = WriteBehindJournal(self.dir.name, delay=60)
+        journal.append("put", self.user.id, Session("9002", self.t0, last_update=self.t0))
+        journal.append("flush", self.user.id)
+        journal.flush()
+        self.assertFalse(Attendance.objects.filter(user=self.user).exists())
+        self.assertEqual(journal.segments(), [])
+
+    def test_failing_changes_are_set_aside(self):
+        other = User.objects.create_user("unlucky")
+        journal = WriteBehindJournal(self.dir.name, delay=60)
+        journal.append("put", self.user.id, Session("9003", self.t0, last_update=self.t0))
+        journal.append("put", other.id, Session("9004", self.t0, last_update=self.t0))
+
+        def apply_ops(ops):
+            if any(uid == str(other.id) for _, uid, _ in ops):
+                raise ValueError("bad row")
+            return real_apply_ops(ops)
+
+        with mock.patch("attendance.writebehind.apply_ops", side_effect=apply_ops), \
+                self.assertLogs("attendance", "ERROR"):
+            for _ in range(MAX_ATTEMPTS):
+                self.assertEqual(Attendance.objects.count(), 0)
+                journal.flush()
+
+        self.assertEqual(list(Attendance.objects.values_list("pk", flat=True)), [9003])
+        self.assertEqual(journal.segments(), [])
+        self.assertEqual(journal.stats()["pending"], 0)
+        [kept] = (Path(self.dir.name) / "failed").iterdir()
+        self.assertEqual([(op, uid) for op, uid, _ in read_segment(kept)], [("put", str(other.id))])
+
+
+class SnapshotStoreTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings = override_settings(ATTENDANCE_SNAPSHOT_DIR=tmp.name, ATTENDANCE_SNAPSHOT_INTERVAL=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.t0 = datetime(2025, 11, 25, 9, tzinfo=dt_timezone.utc)
+
+    def _store(self):
+        store = SnapshotSessionStore()
+        self.addCleanup(atexit.unregister, store.save_snapshot)
+        return store
+
+    def _restart(self, store, *user_ids):
+        # what a new process starts from: nothing in memory
+        for uid in user_ids:
+            MemorySessionStore.drop_user(store, uid)
+        return self._store()
+
+    def test_restart_restores_snapshot_and_log(self):
+        store = self._store()
+        done = store.add_session(7001, Session("a", self.t0, self.t0 + timedelta(hours=8), False))
+        store.save_snapshot()
+        open_ = store.add_session(7002, Session("b", self.t0))
+        open_ = store.save_session(7002, open_.replace(breaks=(Break(self.t0 + timedelta(hours=1)),)))
+
+        store = self._restart(store, 7001, 7002)
+        self.assertEqual(store.user_sessions(7001), (done,))
+        self.assertEqual(store.user_sessions(7002), (open_,))
+        self.assertEqual(store.roster(), {"7002": open_})
+        # the replayed log was folded into a new snapshot; older files are gone
+        self.assertEqual(len(list(store.directory.glob("*.snapshot"))), 1)
+        self.assertEqual([p.stat().st_size for p in store.log.segments()], [0])
+        store.drop_user(7001)
+        store.drop_user(7002)
+
+    def test_flush_is_replayed(self):
+        store = self._store()
+        store.add_session(7003, Session("c", self.t0))
+        store.flush_user(7003)
+        store = self._restart(store, 7003)
+        self.assertEqual(store.user_sessions(7003), ())
+
+    def test_blocking_with_fsync(self):
+        self.assertFalse(self._store().blocking)
+        with override_settings(ATTENDANCE_JOURNAL_FSYNC=True):
+            self.assertTrue(self._store().blocking)
+
+
+class MemoryStoreDateIndexTests(SimpleTestCase):
+    def test_sessions_for_date_during_concurrent_starts(self):
+        store = MemorySessionStore()
+        uid = 7101
+        self.addCleanup(store.drop_user, uid)
+        day = datetime(2025, 11, 25, 9, tzinfo=dt_timezone.utc)
+        errors = []
+        done = threading.Event()
+
+        def export():
+            while not done.is_set():
+                try:
+                    store.sessions_for_date(day.date())
+                except Exception as exc:  # pragma: no cover - the failure being tested
+                    errors.append(exc)
+                    return
+
+        reader = threading.Thread(target=export)
+        reader.start()
+        try:
+            for i in range(3000):
+                store.add_session(uid, Session(f"d{i}", day + timedelta(seconds=i), day, False))
+        finally:
+            done.set()
+            reader.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(store.sessions_for_date(day.date())[str(uid)]), 3000)
+
+    def test_changes_do_not_copy_history(self):
+        store = MemorySessionStore()
+        uid = 7102
+        self.addCleanup(store.drop_user, uid)
+        day = datetime(2025, 11, 25, 9, tzinfo=dt_timezone.utc)
+        for i in range(1000):
+            store.add_session(uid, Session(f"h{i}", day + timedelta(seconds=i), day, False))
+        history = store.get_user_store(uid)["sessions"]
+
+        open_ = store.add_session(uid, Session("open", day + timedelta(hours=1)))
+        on_break = store.save_session(uid, open_.replace(breaks=(Break(day + timedelta(hours=2)),)))
+        self.assertIs(store.get_user_store(uid)["sessions"], history)
+        self.assertEqual(store.user_sessions(uid)[-1], on_break)
+        self.assertEqual(store.active_session(uid), on_break)
+
+
+class StaticStorageTests(SimpleTestCase):
+    def test_page_renders_before_collectstatic(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(DEBUG=False, STATIC_ROOT=root):
+            html = render_to_string("index.html")
+        self.assertIn('href="/static/attendance/style.css"', html)
+        self.assertIn('src="/static/attendance/app.js"', html)
+
+
+class EmployeeTrackingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user("tracker", is_staff=True)
+        cls.user = User.objects.create_user("tracked")
+
+    def setUp(self):
+        # through the configured store, whichever it is
+        store = get_session_store()
+        self.addCleanup(store.flush_user, self.user.id)
+        t0 = datetime(2025, 11, 1, 9, tzinfo=dt_timezone.utc)
+        for day in range(5):
+            start = t0 + timedelta(days=day)
+            store.add_session(self.user.id, Session(f"t{day}", start, start + timedelta(hours=8), False,
+                                                    last_update=start))
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.url = f"/api/attendance/employees/{self.user.id}/tracking/"
+
+    def starts(self, resp):
+        return [s["start_time"][:10] for s in resp.json()["sessions"]]
+
+    def test_since_until(self):
+        resp = self.client.get(self.url, {"since": "2025-11-02", "until": "2025-11-03"})
+        self.assertEqual(self.starts(resp), ["2025-11-02", "2025-11-03"])
+        self.assertIsNone(resp.json()["next_cursor"])
+
+    def test_cursor_pages_back(self):
+        pages = []
+        params = {"limit": 2}
+        while True:
+            body = self.client.get(self.url, params).json()
+            pages.append([s["start_time"][:10] for s in body["sessions"]])
+            if body["next_cursor"] is None:
+                break
+            params["cursor"] = body["next_cursor"]
+        self.assertEqual(pages, [
+            ["2025-11-04", "2025-11-05"], ["2025-11-02", "2025-11-03"], ["2025-11-01"],
+        ])
+
+    def test_bad_parameters(self):
+        for params in (
+            {"since": "yesterday"},
+            {"limit": "ten"},
+            {"cursor": "99999999999999999999"},
+            {"cursor": "-99999999999999999999"},
+            {"until": "9999-12-31"},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+
+class RefreshFlowTests(TestCase):
+    """An end within REFRESH_GRACE_MS of the last change is a page reload, not a logout."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("reloader")
+        self.store = get_session_store()
+        self.addCleanup(self.store.drop_user, self.user.id)
+        self.addCleanup(self.store.flush_user, self.user.id)
+        queue = mock.patch("attendance.views.queue_session")
+        self.queued = queue.start()
+        self.addCleanup(queue.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, url):
+        return self.client.post(f"/api/attendance/{url}").json()
+
+    def active(self):
+        return self.client.get("/api/attendance/status/").json()["active_attendance"]
+
+    def age_last_change(self, seconds):
+        last = self.store.last_session(self.user.id)
+        self.store.save_session(self.user.id, last.replace(last_update=last.last_update - timedelta(seconds=seconds)))
+
+    def test_reload_then_revive(self):
+        sid = self.post("start/")["attendance"]["id"]
+        self.assertEqual(self.post("end/")["detail"], "Temporary refresh end")
+        self.assertIsNone(self.active())
+        self.queued.assert_not_called()
+
+        revived = self.post("revive_if_recent/")
+        self.assertEqual(revived["detail"], "Revived")
+        self.assertEqual(revived["attendance"]["id"], sid)
+        self.assertEqual(self.active()["id"], sid)
+        self.assertEqual(self.post("revive_if_recent/")["detail"], "Already active")
+
+    def test_reload_then_start_restores(self):
+        sid = self.post("start/")["attendance"]["id"]
+        self.post("end/")
+        restored = self.post("start/")
+        self.assertEqual(restored["detail"], "Restored session after refresh")
+        self.assertEqual(restored["attendance"]["id"], sid)
+        self.assertEqual(self.active()["id"], sid)
+        self.assertEqual(len(self.store.user_sessions(self.user.id)), 1)
+
+    def test_revive_too_late(self):
+        self.post("start/")
+        self.post("end/")
+        self.age_last_change(5)
+        self.assertEqual(self.post("revive_if_recent/")["detail"], "Too old to revive")
+        self.assertIsNone(self.active())
+
+    def test_real_logout_is_not_revived(self):
+        sid = self.post("start/")["attendance"]["id"]
+        self.post("break/toggle/")
+        self.age_last_change(5)
+        ended = self.post("end/")
+        self.assertEqual(ended["detail"], "Attendance ended")
+        self.assertIsNotNone(ended["attendance"]["breaks"][0]["end_time"])
+        self.queued.assert_called_once()
+        self.assertEqual(self.post("revive_if_recent/")["detail"], "Not ended by refresh")
+
+        started = self.post("start/")
+        self.assertEqual(started["detail"], "Attendance started")
+        self.assertNotEqual(started["attendance"]["id"], sid)
+
+
+class DatabaseStoreTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("starter")
+        self.store = DatabaseSessionStore()
+
+    def test_start_twice_keeps_one_open_session(self):
+        with mock.patch("attendance.views.get_session_store", return_value=self.store):
+            first, status = _start_attendance(self.user)
+            self.assertEqual(status, 201)
+            second, status = _start_attendance(self.user)
+        self.assertEqual(status, 200)
+        self.assertEqual(second["attendance"]["id"], first["attendance"]["id"])
+        self.assertEqual(Attendance.objects.filter(user=self.user, is_active=True).count(), 1)
+
+    def test_nothing_is_kept_in_memory(self):
+        t0 = datetime(2025, 11, 25, 9, tzinfo=dt_timezone.utc)
+        sess = self.store.add_session(self.user.id, Session("new", t0, last_update=t0))
+        self.assertEqual(self.store.active_session(self.user.id), sess)
+        self.assertNotIn(str(self.user.id), ATTENDANCE_STORE)
+
+
+class DatabaseStoreTransactionTests(TransactionTestCase):
+    """Read-then-write paths hold the database write lock, so other workers wait for them."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("racer")
+        self.store = DatabaseSessionStore()
+        for patcher in (
+            mock.patch("attendance.views.get_session_store", return_value=self.store),
+            mock.patch("attendance.views.queue_session"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        t0 = timezone.now() - timedelta(hours=1)
+        self.sess = self.store.add_session(self.user.id, Session("s", t0, last_update=t0))
+
+    def test_reads_inside_the_transaction(self):
+        real = self.store.active_session
+        seen = []
+
+        def active_session(user_id):
+            seen.append(connection.in_atomic_block)
+            return real(user_id)
+
+        with mock.patch.object(self.store, "active_session", side_effect=active_session):
+            _toggle_break(self.user)
+            _end_attendance(self.user, {})
+            _revive_attendance(self.user)
+        self.assertEqual(seen, [True, True, True])
+
+    def test_end_by_another_worker_during_a_break_toggle(self):
+        read, go = threading.Event(), threading.Event()
+        real = self.store.active_session
+
+        def active_session(user_id):
+            sess = real(user_id)
+            read.set()
+            go.wait(5)
+            return sess
+
+        with mock.patch.object(self.store, "active_session", side_effect=active_session):
+            def toggle():
+                try:
+                    _toggle_break(self.user)
+                finally:
+                    connection.close()
+
+            toggler = threading.Thread(target=toggle)
+            toggler.start()
+            read.wait(5)
+
+            def other_worker_ends():
+                with transaction.atomic():
+                    Attendance.objects.filter(pk=self.sess.id).update(is_active=False, end_time=timezone.now())
+
+            try:
+                other_worker_ends()
+                blocked = False
+            except OperationalError:
+                blocked = True
+            go.set()
+            toggler.join()
+
+        if blocked:
+            other_worker_ends()
+        a = Attendance.objects.get(pk=self.sess.id)
+        self.assertFalse(a.is_active)
+        self.assertIsNotNone(a.end_time)
+        self.assertTrue(blocked)
+
+
+class WorkerThreadConnectionTests(SimpleTestCase):
+    def test_connections_are_checked_around_the_call(self):
+        calls = []
+
+        def fn(x):
+            calls.append(x)
+            if x == "fail":
+                raise ValueError(x)
+            return x
+
+        with mock.patch("attendance.store.close_old_connections", side_effect=lambda: calls.append("close")):
+            self.assertEqual(async_to_sync(db_sync_to_async(fn))("ok"), "ok")
+            with self.assertRaises(ValueError):
+                async_to_sync(db_sync_to_async(fn))("fail")
+        self.assertEqual(calls, ["close", "ok", "close", "close", "fail", "close"])
+
+
+class AsgiCSVExportTests(TransactionTestCase):
+    async def test_range_is_streamed_asynchronously(self):
+        user = await User.objects.acreate(username="exporter")
+        token = str(AccessToken.for_user(user))
+        resp = await AsyncClient().get(
+            "/api/attendance/export/2025-11-01/2025-11-03/", headers={"authorization": f"Bearer {token}"},
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.is_async)
+        body = b"".join([chunk async for chunk in resp.streaming_content]).decode()
+        self.assertTrue(body.startswith("Username,"))
+
+
+# the hot endpoints as urls.py routes them when ATTENDANCE_ASYNC_VIEWS is on
+urlpatterns = [
+    path("start/", AsyncStartAttendanceView.as_view()),
+    path("end/", AsyncEndAttendanceView.as_view()),
+    path("break/toggle/", AsyncToggleBreakView.as_view()),
+    path("status/", AsyncCurrentStatusView.as_view()),
+    path("revive_if_recent/", AsyncReviveAttendanceView.as_view()),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncStoreBackendTests(TransactionTestCase):
+    """Under ASGI the store is first built by an async view, whichever backend is configured."""
+
+    stores = [
+        "attendance.store.MemorySessionStore",
+        "attendance.store.DatabaseSessionStore",
+        "attendance.writebehind.WriteBehindSessionStore",
+        "attendance.snapshots.SnapshotSessionStore",
+    ]
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings = override_settings(
+            ATTENDANCE_JOURNAL_DIR=Path(tmp.name) / "journal",
+            ATTENDANCE_WRITE_BEHIND_DELAY=60,
+            ATTENDANCE_SNAPSHOT_DIR=Path(tmp.name) / "snapshots",
+            ATTENDANCE_SNAPSHOT_INTERVAL=0,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # the CSV row is not what is tested here
+        queue = mock.patch("attendance.views.queue_session")
+        queue.start()
+        self.addCleanup(queue.stop)
+        self.addCleanup(get_session_store.cache_clear)
+
+        self.user = User.objects.create_user("asyncer")
+        self.headers = {"authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def _request(self, method, url):
+        return async_to_sync(getattr(self.async_client, method))(url, headers=self.headers)
+
+    def _reset(self, store):
+        store.flush_user(self.user.id)
+        store.drop_user(self.user.id)
+        if hasattr(store, "journal"):
+            store.journal.flush()
+            atexit.unregister(store.journal.flush)
+        if hasattr(store, "save_snapshot"):
+            atexit.unregister(store.save_snapshot)
+
+    def test_every_store(self):
+        for store_path in self.stores:
+            with self.subTest(store=store_path), override_settings(ATTENDANCE_SESSION_STORE=store_path):
+                # nothing has built the store yet: the first request does
+                get_session_store.cache_clear()
+                try:
+                    self.assertEqual(self._request("post", "/start/").status_code, 201)
+                    self.assertIsNotNone(self._request("get", "/status/").json()["active_attendance"])
+                    self.assertEqual(self._request("post", "/end/").status_code, 200)
+                    self.assertIsNone(self._request("get", "/status/").json()["active_attendance"])
+                finally:
+                    self._reset(get_session_store())
+
+
+class EmployeeStatusTests(TestCase):
+    url = "/api/attendance/employees/status/"
+
+    def setUp(self):
+        self.user = User.objects.create_user("rostered")
+        self.store = get_session_store()
+        self.addCleanup(self.store.drop_user, self.user.id)
+        self.addCleanup(self.store.flush_user, self.user.id)
+        queue = mock.patch("attendance.views.queue_session")
+        queue.start()
+        self.addCleanup(queue.stop)
+
+        self.t0 = datetime(2025, 11, 24, 9, tzinfo=dt_timezone.utc)
+        self.now = self.t0
+        clock = mock.patch("django.utils.timezone.now", side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+        self.employee = APIClient()
+        self.employee.force_authenticate(self.user)
+        self.admin = APIClient()
+        self.admin.force_authenticate(User.objects.create_user("supervisor", is_staff=True))
+
+    def at(self, minutes):
+        self.now = self.t0 + timedelta(minutes=minutes)
+
+    def status(self):
+        body = self.admin.get(self.url).json()
+        [row] = [u for u in body["employees"] if u["id"] == self.user.id]
+        return body["clocked_in"], {k: row[k] for k in ("clocked_in", "on_break", "worked_minutes")}
+
+    def test_follows_the_session(self):
+        self.assertEqual(self.status(), (0, {"clocked_in": False, "on_break": False, "worked_minutes": 0}))
+
+        self.employee.post("/api/attendance/start/")
+        self.at(60)
+        self.employee.post("/api/attendance/break/toggle/")
+        self.at(90)
+        self.assertEqual(self.status(), (1, {"clocked_in": True, "on_break": True, "worked_minutes": 60}))
+
+        self.at(100)
+        self.employee.post("/api/attendance/break/toggle/")
+        self.at(130)
+        self.assertEqual(self.status(), (1, {"clocked_in": True, "on_break": False, "worked_minutes": 90}))
+
+        self.assertEqual(self.employee.post("/api/attendance/end/").json()["detail"], "Attendance ended")
+        self.at(200)
+        self.assertEqual(self.status(), (0, {"clocked_in": False, "on_break": False, "worked_minutes": 0}))
+
+        self.employee.post("/api/attendance/start/")
+        self.at(215)
+        self.assertEqual(self.status(), (1, {"clocked_in": True, "on_break": False, "worked_minutes": 15}))
+        self.admin.post(f"/api/attendance/auth/admin/flush/{self.user.id}/")
+        self.assertEqual(self.status(), (0, {"clocked_in": False, "on_break": False, "worked_minutes": 0}))
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncEndpointTests(TransactionTestCase):
+    def setUp(self):
+        queue = mock.patch("attendance.views.queue_session")
+        self.queued = queue.start()
+        self.addCleanup(queue.stop)
+        self.user = User.objects.create_user("asyncer")
+        self.store = get_session_store()
+        self.addCleanup(self.store.drop_user, self.user.id)
+        self.addCleanup(self.store.flush_user, self.user.id)
+        self.token = str(AccessToken.for_user(self.user))
+
+    def request(self, method, url, token=None, **kwargs):
+        headers = {"authorization": f"Bearer {token or self.token}"}
+        return async_to_sync(getattr(self.async_client, method))(url, headers=headers, **kwargs)
+
+    def beacon(self, url, token):
+        # what navigator.sendBeacon() sends: no header, the token in the body
+        return async_to_sync(self.async_client.post)(url, {"token": token}, content_type="application/json")
+
+    def active(self):
+        return self.request("get", "/status/").json()["active_attendance"]
+
+    def age_last_change(self, seconds):
+        last = self.store.last_session(self.user.id)
+        self.store.save_session(self.user.id, last.replace(last_update=last.last_update - timedelta(seconds=seconds)))
+
+    def test_start_toggle_status_end(self):
+        resp = self.request("post", "/start/")
+        self.assertEqual(resp.status_code, 201)
+        sid = resp.json()["attendance"]["id"]
+        resp = self.request("post", "/start/")
+        self.assertEqual((resp.status_code, resp.json()["attendance"]["id"]), (200, sid))
+
+        resp = self.request("post", "/break/toggle/")
+        self.assertEqual((resp.status_code, resp.json()["detail"]), (201, "Break started"))
+        self.assertIsNone(self.active()["breaks"][0]["end_time"])
+        resp = self.request("post", "/break/toggle/")
+        self.assertEqual((resp.status_code, resp.json()["detail"]), (200, "Break ended"))
+        self.assertIsNotNone(self.active()["breaks"][0]["end_time"])
+
+        self.age_last_change(5)
+        resp = self.request("post", "/end/")
+        self.assertEqual((resp.status_code, resp.json()["detail"]), (200, "Attendance ended"))
+        self.queued.assert_called_once()
+        self.assertIsNone(self.active())
+        self.assertEqual(self.request("get", "/status/").json()["last_attendance"]["id"], sid)
+        self.assertEqual(self.request("post", "/break/toggle/").status_code, 400)
+
+    def test_beacon_end_and_revive(self):
+        sid = self.request("post", "/start/").json()["attendance"]["id"]
+        self.assertEqual(self.beacon("/end/", self.token).json()["detail"], "Temporary refresh end")
+        self.assertIsNone(self.active())
+
+        resp = self.beacon("/revive_if_recent/", self.token)
+        self.assertEqual((resp.status_code, resp.json()["detail"]), (200, "Revived"))
+        self.assertEqual(self.active()["id"], sid)
+
+        self.age_last_change(5)
+        self.assertEqual(self.beacon("/end/", self.token).json()["detail"], "Attendance ended")
+        self.assertEqual(self.beacon("/revive_if_recent/", self.token).json()["detail"], "Not ended by refresh")
+
+    def test_bad_bearer_token(self):
+        for method, url in (("post", "/start/"), ("post", "/break/toggle/"), ("get", "/status/")):
+            with self.subTest(url=url):
+                resp = self.request(method, url, token="not-a-jwt")
+                self.assertEqual(resp.status_code, 401)
+                self.assertEqual(resp["WWW-Authenticate"], 'Bearer realm="api"')
+                resp = async_to_sync(getattr(self.async_client, method))(url)
+                self.assertEqual(resp.status_code, 401)
+                self.assertEqual(resp["WWW-Authenticate"], 'Bearer realm="api"')
+        self.assertIsNone(self.store.last_session(self.user.id))
+
+    def test_bad_body_token(self):
+        self.request("post", "/start/")
+        for url in ("/end/", "/revive_if_recent/"):
+            with self.subTest(url=url):
+                self.assertEqual(self.beacon(url, "not-a-jwt").status_code, 401)
+                self.assertEqual(async_to_sync(self.async_client.post)(url).status_code, 401)
+        self.assertIsNotNone(self.active())
+
+
+class EmployeeListETagTests(TestCase):
+    url = "/api/attendance/employees/"
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("lister", is_staff=True))
+
+    def test_revalidation(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        User.objects.create_user("newcomer")
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("newcomer", [u["username"] for u in resp.json()["employees"]])
+
+    def test_change_made_by_another_worker(self):
+        etag = self.client.get(self.url)["ETag"]
+        # what another process's bump leaves behind: only the row changed
+        TableVersion.objects.filter(name=USER_VERSION_KEY).update(version=F("version") + 1)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class LiveEventsTests(TransactionTestCase):
+    def test_not_served_under_wsgi(self):
+        user = User.objects.create_user("syncer")
+        client = APIClient()
+        client.force_authenticate(user)
+        self.assertEqual(client.post("/api/attendance/events/token/").json(), {"live": False})
+        resp = self.client.get("/api/attendance/events/", {"token": issue_stream_token(user)})
+        self.assertEqual(resp.status_code, 204)
+
+    async def test_stream_token(self):
+        user = await User.objects.acreate(username="streamer")
+        access = str(AccessToken.for_user(user))
+        client = AsyncClient()
+        grant = (await client.post(
+            "/api/attendance/events/token/", headers={"authorization": f"Bearer {access}"},
+        )).json()
+        self.assertTrue(grant["live"])
+
+        # the access token itself is not accepted in the URL
+        resp = await client.get("/api/attendance/events/", {"token": access})
+        self.assertEqual(resp.status_code, 401)
+        with override_settings(ATTENDANCE_EVENTS_TOKEN_MAX_AGE=-1):
+            resp = await client.get("/api/attendance/events/", {"token": grant["token"]})
+        self.assertEqual(resp.status_code, 401)
+
+        resp = await client.get("/api/attendance/events/", {"token": grant["token"]})
+        self.assertEqual(resp["Content-Type"], "text/event-stream")
+        stream = aiter(resp.streaming_content)
+        self.assertEqual(await anext(stream), b"retry: 3000\n\n")
+        await stream.aclose()
+
+
+class CSVDayFileTests(TestCase):
+    day = date(2001, 2, 3)
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings = override_settings(CSV_EXPORT_DIR=tmp.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        invalidate_csv_cache()
+        self.addCleanup(invalidate_csv_cache)
+
+    def _lines(self, path):
+        return Path(path).read_text(encoding="utf-8").splitlines()[1:]
+
+    def test_append_and_patch(self):
+        path = _record_rows(self.day, {})
+        _record_rows(self.day, {"a": "a,1\r\n"})
+        _record_rows(self.day, {"b": "b,1\r\n"})
+        self.assertEqual(self._lines(path), ["a,1", "b,1"])
+
+        _record_rows(self.day, {"a": "a,2\r\n"})
+        self.assertEqual(self._lines(path), ["a,2", "b,1"])
+
+    def test_only_recent_days_are_cached(self):
+        days = [date(2001, 2, d) for d in range(1, 5)]
+        with mock.patch("attendance.exports._DAY_FILES_MAX", 2):
+            for day in days[:3]:
+                _record_rows(day, {})
+            _record_rows(days[1], {"a": "a,1\r\n"})
+            _record_rows(days[3], {})
+        self.assertEqual(list(_DAY_FILES), [days[1], days[3]])
+
+    def test_regenerates_a_file_it_did_not_write(self):
+        user = User.objects.create_user("exporter")
+        store = get_session_store()
+        start = datetime(2001, 2, 3, 12, tzinfo=dt_timezone.utc)
+        store.add_session(user.id, Session("x", start, start + timedelta(hours=1), False))
+        self.addCleanup(store.drop_user, user.id)
+
+        # nothing cached yet: the rows come from the store, not from the call
+        path = _record_rows(self.day, {"stray": "stray\r\n"})
+        self.assertEqual(len(self._lines(path)), 1)
+        self.assertTrue(self._lines(path)[0].startswith("exporter,"))
+
+        # changed behind our back: appending would extend someone else's file
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("edited elsewhere\n")
+        _record_rows(self.day, {"stray": "stray\r\n"})
+        self.assertEqual(len(self._lines(path)), 1)
+        self.assertTrue(self._lines(path)[0].startswith("exporter,"))
+
+
+class ExportDailyCSVCommandTests(TestCase):
+    days = [date(2001, 2, 3), date(2001, 2, 4), date(2001, 2, 6)]
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.out = Path(tmp.name) / "out"
+        settings = override_settings(CSV_EXPORT_DIR=Path(tmp.name) / "live")
+        settings.enable()
+        self.addCleanup(settings.disable)
+        invalidate_csv_cache()
+        self.addCleanup(invalidate_csv_cache)
+
+        # the command reads the tables, so seed them through the database store
+        self.store = DatabaseSessionStore()
+        store = mock.patch("attendance.exports.get_session_store", return_value=self.store)
+        store.start()
+        self.addCleanup(store.stop)
+        for name, hour in (("early", 7), ("late", 21)):
+            user = User.objects.create_user(name, first_name=name.title(), last_name="Bird")
+            for day in self.days:
+                start = datetime.combine(day, datetime.min.time(), tzinfo=dt_timezone.utc) + timedelta(hours=hour)
+                self.store.add_session(user.id, Session(
+                    "", start, start + timedelta(hours=2, minutes=5), False,
+                    breaks=[Break(start + timedelta(minutes=30), start + timedelta(minutes=45))],
+                    last_update=start,
+                ))
+
+    def export(self, *args):
+        out = io.StringIO()
+        call_command("export_daily_csv", *args, "--output-dir", str(self.out), stdout=out)
+        return out.getvalue()
+
+    def exported(self):
+        return sorted(p.name for p in self.out.iterdir())
+
+    def assertSameAsLive(self, day):
+        live = Path(_save_csv_user_date(day)).read_bytes()
+        self.assertEqual((self.out / f"attendance_{day}.csv").read_bytes(), live)
+        self.assertEqual(len(live.decode().splitlines()), 3)
+
+    def test_date(self):
+        self.assertIn("Exported 1 day(s), 2 row(s).", self.export("--date", "2001-02-04"))
+        self.assertEqual(self.exported(), ["attendance_2001-02-04.csv"])
+        self.assertSameAsLive(self.days[1])
+
+    def test_range(self):
+        self.assertIn("Exported 4 day(s), 6 row(s).", self.export("--start", "2001-02-03", "--end", "2001-02-06"))
+        self.assertEqual(self.exported(), [f"attendance_2001-02-0{d}.csv" for d in (3, 4, 5, 6)])
+        for day in self.days:
+            self.assertSameAsLive(day)
+        self.assertEqual((self.out / "attendance_2001-02-05.csv").read_bytes(),
+                         Path(_save_csv_user_date(date(2001, 2, 5))).read_bytes())
+
+    def test_all(self):
+        self.assertIn("Exported 3 day(s), 6 row(s).", self.export("--all"))
+        self.assertEqual(self.exported(), [f"attendance_{d}.csv" for d in self.days])
+        for day in self.days:
+            self.assertSameAsLive(day)
+
+    def test_bad_bounds(self):
+        for args, message in (
+            (("--start", "2001-02-03"), "--start and --end must be given together"),
+            (("--end", "2001-02-03"), "--start and --end must be given together"),
+            (("--start", "2001-02-06", "--end", "2001-02-03"), "--start must not be after --end"),
+            (("--date", "03/02/2001"), "Invalid date"),
+        ):
+            with self.subTest(args=args), self.assertRaisesMessage(CommandError, message):
+                self.export(*args)
+        self.assertFalse(self.out.exists())
+
+
+class TimeFormatterTests(SimpleTestCase):
+    """Memoizing by minute must not change a byte of the CSV."""
+
+    def direct_row(self, s, tz):
+        def full(dt):
+            return dt.astimezone(tz).strftime("%d %b %Y, %I:%M %p")
+
+        def clock(dt):
+            return dt.astimezone(tz).strftime("%I:%M %p")
+
+        minutes = int((s.end_time - s.start_time).total_seconds() // 60)
+        return [
+            "u", "U", full(s.start_time), full(s.end_time), "Completed",
+            f"{minutes // 60}h {minutes % 60}m", len(s.breaks),
+            "\n".join(f"{clock(b.start_time)} → {clock(b.end_time)}" for b in s.breaks),
+        ]
+
+    def test_matches_strftime(self):
+        utc = dt_timezone.utc
+        sessions = [
+            # 00:50 EDT to 02:10 EST: 01:30 local happens twice, 05:30 and 06:30 UTC
+            Session("dst", datetime(2025, 11, 2, 4, 50, 59, 999999, tzinfo=utc),
+                    datetime(2025, 11, 2, 7, 10, tzinfo=utc), False, breaks=[
+                        Break(datetime(2025, 11, 2, 5, 30, tzinfo=utc), datetime(2025, 11, 2, 5, 45, 30, tzinfo=utc)),
+                        Break(datetime(2025, 11, 2, 6, 30, tzinfo=utc), datetime(2025, 11, 2, 6, 45, tzinfo=utc)),
+                    ]),
+            # 22:55 on the 23rd to 01:20 on the 24th, New York time
+            Session("midnight", datetime(2025, 11, 24, 3, 55, 1, tzinfo=utc),
+                    datetime(2025, 11, 24, 6, 20, tzinfo=utc), False, breaks=[
+                        Break(datetime(2025, 11, 24, 4, 59, 59, tzinfo=utc), datetime(2025, 11, 24, 5, 0, 1, tzinfo=utc)),
+                    ]),
+        ]
+        for name in ("America/New_York", "Asia/Kolkata"):
+            tz = zoneinfo.ZoneInfo(name)
+            fmt = _TimeFormatter(tz)
+            for s in sessions + sessions:  # the second pass is served from the memo
+                with self.subTest(zone=name, session=s.id):
+                    row = _session_row("u", "U", s, fmt)
+                    self.assertEqual(_encode(row).encode(), _encode(self.direct_row(s, tz)).encode())
+
+        fmt = _TimeFormatter(zoneinfo.ZoneInfo("America/New_York"))
+        self.assertEqual(_session_row("u", "U", sessions[0], fmt)[7], "01:30 AM → 01:45 AM\n01:30 AM → 01:45 AM")
+        self.assertEqual(_session_row("u", "U", sessions[1], fmt)[2:4], ["23 Nov 2025, 10:55 PM", "24 Nov 2025, 01:20 AM"])
+
+
+class ExportQueueTests(SimpleTestCase):
+    def test_coalesces_per_session(self):
+        queue = ExportQueue()
+        d1, d2 = date(2025, 11, 25), date(2025, 11, 26)
+        with mock.patch("attendance.exports._record_rows") as write:
+            queue.submit(d1, "s1", "old", 60)
+            queue.submit(d1, "s1", "new", 60)
+            queue.submit(d1, "s2", "other", 60)
+            queue.submit(d2, "s1", "later", 60)
+            self.assertEqual(queue.stats(), {
+                "pending": 3, "pending_dates": 2, "enqueued": 4, "flushed": 0, "failed": 0,
+            })
+            write.assert_not_called()
+
+            queue.flush()
+        self.assertEqual(write.call_args_list, [
+            mock.call(d1, {"s1": "new", "s2": "other"}),
+            mock.call(d2, {"s1": "later"}),
+        ])
+        self.assertEqual(queue.stats()["pending"], 0)
+        self.assertEqual(queue.stats()["flushed"], 3)
+
+    def test_writes_after_delay(self):
+        queue = ExportQueue()
+        written = threading.Event()
+        with mock.patch("attendance.exports._record_rows", side_effect=lambda *a: written.set()):
+            queue.submit(date(2025, 11, 25), "s1", "row", 0.01)
+            self.assertTrue(written.wait(5))
+        self.assertEqual(queue.stats()["pending"], 0)
+
+    def test_failed_batch_is_counted(self):
+        queue = ExportQueue()
+        queue.submit(date(2025, 11, 25), "s1", "row", 60)
+        with mock.patch("attendance.exports._record_rows", side_effect=OSError), \
+                self.assertLogs("attendance", "ERROR"):
+            queue.flush()
+        self.assertEqual(queue.stats()["failed"], 1)
+        self.assertEqual(queue.stats()["flushed"], 0)
+
+
+class BeaconBodyTests(SimpleTestCase):
+    def _parse(self, body, content_type="text/plain"):
+        return _beacon_body(RequestFactory().post("/", body, content_type=content_type))
+
+    def test_json_whatever_the_content_type(self):
+        self.assertEqual(self._parse(b'{"token": "t", "logout_time": 1}'), {"token": "t", "logout_time": 1})
+        self.assertEqual(self._parse(b'  {"token": "t"}'), {"token": "t"})
+        self.assertEqual(self._parse(b'{"token": "t"}', "application/x-www-form-urlencoded"), {"token": "t"})
+
+    def test_form_encoded(self):
+        self.assertEqual(
+            self._parse(b"token=t&token=u&logout_time=1", "application/x-www-form-urlencoded"),
+            {"token": "t", "logout_time": "1"},
+        )
+
+    def test_junk_is_empty(self):
+        self.assertEqual(self._parse(b""), {})
+        self.assertEqual(self._parse(b'["token"]'), {})
+        self.assertEqual(self._parse(b"{not json"), {})
+        self.assertEqual(self._parse(b"just text"), {})
+        self.assertEqual(self._parse(b"\xff=\xfe"), {})
+
+    def test_too_large(self):
+        self.assertIsNone(self._parse(b"x" * (BEACON_MAX_BYTES + 1)))
+        request = RequestFactory().post("/", b"{}", content_type="text/plain")
+        request.META["CONTENT_LENGTH"] = str(BEACON_MAX_BYTES + 1)
+        self.assertIsNone(_beacon_body(request))
+
+        resp = self.client.post("/api/attendance/end/", b"x" * (BEACON_MAX_BYTES + 1), content_type="text/plain")
+        self.assertEqual(resp.status_code, 413)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        invalidate_cached_user()
+        self.addCleanup(invalidate_cached_user)
+        self.user = User.objects.create_user("cached")
+        self.auth = CachedJWTAuthentication()
+        self.token = AccessToken.for_user(self.user)
+
+    def test_served_from_cache_until_invalidated(self):
+        self.assertEqual(self.auth.get_user(self.token), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.auth.get_user(self.token), self.user)
+
+        User.objects.filter(pk=self.user.pk).update(first_name="Renamed")
+        self.assertEqual(self.auth.get_user(self.token).first_name, "")
+        invalidate_cached_user(self.user.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.auth.get_user(self.token).first_name, "Renamed")
+
+    def test_admin_change_is_seen_on_next_request(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        self.assertFalse(client.get("/api/attendance/auth/me/").json()["is_staff"])
+
+        admin = APIClient()
+        admin.force_authenticate(User.objects.create_user("boss", is_staff=True))
+        admin.post(f"/api/attendance/auth/admin/promote/{self.user.id}/", {"is_staff": True})
+        self.assertTrue(client.get("/api/attendance/auth/me/").json()["is_staff"])
+
+
+class BeaconRejectCacheTests(SimpleTestCase):
+    def setUp(self):
+        authentication._REJECTED.clear()
+        self.addCleanup(authentication._REJECTED.clear)
+        self.calls = []
+
+        def backend(token):
+            self.calls.append(token)
+            raise AuthenticationFailed("no")
+
+        settings = override_settings(ATTENDANCE_BEACON_AUTH_BACKENDS=["jwt_token"])
+        settings.enable()
+        self.addCleanup(settings.disable)
+        backends = mock.patch.dict(authentication._BEACON_BACKENDS, {"jwt_token": backend})
+        backends.start()
+        self.addCleanup(backends.stop)
+
+    def test_rejected_token_is_not_decoded_again(self):
+        self.assertEqual(authenticate_token("junk"), (None, "none"))
+        self.assertEqual(authenticate_token("junk"), (None, "none"))
+        self.assertEqual(self.calls, ["junk"])
+
+    @override_settings(ATTENDANCE_BEACON_REJECT_TTL=0)
+    def test_disabled(self):
+        authenticate_token("junk")
+        authenticate_token("junk")
+        self.assertEqual(self.calls, ["junk", "junk"])
+
+    def test_broken_backend_is_not_a_rejection(self):
+        with mock.patch.dict(authentication._BEACON_BACKENDS, {"jwt_token": mock.Mock(side_effect=RuntimeError)}), \
+                self.assertLogs("attendance", "ERROR"):
+            self.assertEqual(authenticate_token("junk"), (None, "none"))
+        authenticate_token("junk")
+        self.assertEqual(self.calls, ["junk"])
@@ -1,14 +1,18 @@
 # attendance/urls.py
-from django.urls import path
+from django.conf import settings
+from django.urls import path, register_converter
 from .views import (
     StartAttendanceView,
     EndAttendanceView,
     ToggleBreakView,
     CurrentStatusView,
+    AttendanceEventsView,
+    EventsTokenView,
     ReviveAttendanceView,
 
     DailyCSVExportView,
     CSVExportByDateView,
+    CSVExportRangeView,
     SaveCSVToServerView,
 
     FlushOtherUserDataView,
@@ -17,23 +21,51 @@ from .views import (
 
     AdminCreateUserView,
     EmployeeListView,
+    EmployeeStatusView,
     EmployeeTrackingView,
     PromoteDemoteUserView,
     CurrentUserView,
 )
 
+
+class IsoDateConverter:
+    """YYYY-MM-DD path segment (kept as a string; the view parses it)."""
+    regex = r"\d{4}-\d{2}-\d{2}"
+
+    def to_python(self, value):
+        return value
+
+    def to_url(self, value):
+        return str(value)
+
+
+register_converter(IsoDateConverter, "isodate")
+
+# ASGI deployments serve the hot endpoints with the async views
+if getattr(settings, "ATTENDANCE_ASYNC_VIEWS", False):
+    from .async_views import (
+        AsyncStartAttendanceView as StartAttendanceView,
+        AsyncEndAttendanceView as EndAttendanceView,
+        AsyncToggleBreakView as ToggleBreakView,
+        AsyncCurrentStatusView as CurrentStatusView,
+        AsyncReviveAttendanceView as ReviveAttendanceView,
+    )
+
 urlpatterns = [
     path('start/', StartAttendanceView.as_view()),
     path('end/', EndAttendanceView.as_view()),
     path('break/toggle/', ToggleBreakView.as_view()),
     path('status/', CurrentStatusView.as_view()),
     path('revive_if_recent/', ReviveAttendanceView.as_view()),
+    path('events/', AttendanceEventsView.as_view()),
+    path('events/token/', EventsTokenView.as_view()),
 
     # CSV export
     path('export/today/', DailyCSVExportView.as_view()),
     path('export/<int:year>/<int:month>/<int:day>/', CSVExportByDateView.as_view()),
     path('export/save/today/', SaveCSVToServerView.as_view()),
     path('export/save/<int:year>/<int:month>/<int:day>/', SaveCSVToServerView.as_view()),
+    path('export/<isodate:start>/<isodate:end>/', CSVExportRangeView.as_view()),
 
     # Admin-only
     path('auth/admin/flush/<int:user_id>/', FlushOtherUserDataView.as_view()),
@@ -46,5 +78,6 @@ urlpatterns = [
     path('auth/me/', CurrentUserView.as_view()),
 
     path('employees/', EmployeeListView.as_view()),
+    path('employees/status/', EmployeeStatusView.as_view()),
     path('employees/<int:user_id>/tracking/', EmployeeTrackingView.as_view()),
 ]
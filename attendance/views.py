@@ -2,26 +2,38 @@
 # FINAL VERSION — Refresh-safe attendance, correct logout-on-close,
 # admin delete/flush, CSV auto-save, timezone-safe.
 
-import csv
 import os
 import json
-import copy
 import logging
-import threading
 from uuid import uuid4
-from pathlib import Path
-from datetime import datetime, timedelta
+from urllib.parse import parse_qsl
+from datetime import datetime, timedelta, timezone as dt_timezone
 
-from django.conf import settings
-from django.http import JsonResponse, HttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.http import parse_etags
+from django.views import View
 from django.contrib.auth.models import User
 from django.contrib.auth.hashers import make_password
 
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authentication import get_authorization_header
+
+from .authentication import authenticate_token, invalidate_cached_user
+from .events import (
+    ADMIN_CHANNEL, EVENT_BUS, AsyncSubscription, format_sse, issue_stream_token,
+    publish_session_event, stream_token_max_age, stream_token_user_id, user_channel,
+)
+from .signals import user_table_version
+from .sqlite import retry_on_locked
+from .store import get_session_store, user_lock
+from .records import Break, Session, from_epoch_us, to_epoch_us
+from .exports import (
+    _save_csv_user_date, aiter_csv, iter_csv,
+    invalidate_csv_cache, invalidate_user_name, queue_session,
+)
 
 logger = logging.getLogger("attendance")
 
@@ -29,57 +41,113 @@ logger = logging.getLogger("attendance")
 # GLOBALS
 # -------------------------------------------------------------
 
-STORE_LOCK = threading.RLock()
-ATTENDANCE_STORE = {}  # user_id → {"sessions": []}
-
 # NOTE: This server-side grace should match the client-side CLOSE_GRACE_MS.
 # You asked for a 1 second client grace — keep them aligned.
 REFRESH_GRACE_MS = 1000  # 1 second
 
+# Longest range accepted by the export/<start>/<end>/ endpoint.
+EXPORT_RANGE_MAX_DAYS = 366
+
+# employees/ page size (default and largest accepted ?limit=)
+EMPLOYEE_PAGE_SIZE = 500
+EMPLOYEE_PAGE_MAX = 1000
+
+# largest ?limit= accepted by employees/<id>/tracking/
+TRACKING_PAGE_MAX = 500
 
-CSV_HEADER = [
-    "Username", "Full Name",
-    "Session Start", "Session End",
-    "Status", "Duration",
-    "Break Count", "Break Details"
-]
 
 # -------------------------------------------------------------
 # Helpers
 # -------------------------------------------------------------
 
 
-def _get_user_store(user):
-    uid = str(user.id)
-    with STORE_LOCK:
-        if uid not in ATTENDANCE_STORE:
-            ATTENDANCE_STORE[uid] = {"sessions": []}
-        return ATTENDANCE_STORE[uid]
-
-
 def _current_active_session(user):
-    store = _get_user_store(user)
-    for s in reversed(store["sessions"]):
-        if s.get("is_active", False):
-            return s
-    return None
+    return get_session_store().active_session(user.id)
 
 
 def _last_session(user):
-    store = _get_user_store(user)
-    if not store["sessions"]:
+    return get_session_store().last_session(user.id)
+
+
+def _save_session(user, sess, event=None):
+    """Store a changed copy of a session (built with sess.replace(...)) and announce it as ``event``."""
+    sess = get_session_store().save_session(user.id, sess)
+    if event:
+        publish_session_event(user, event, _serialize_session(sess))
+    return sess
+
+
+def _serialize_session(s):
+    if not s:
         return None
-    return store["sessions"][-1]
+    return {
+        "id": s.id,
+        "start_time": s.start_time.isoformat(),
+        "end_time": s.end_time.isoformat() if s.end_time else None,
+        "is_active": s.is_active,
+        "breaks": [
+            {
+                "start_time": b.start_time.isoformat(),
+                "end_time": b.end_time.isoformat() if b.end_time else None,
+            }
+            for b in s.breaks
+        ]
+    }
 
 
-def _duration_text(start, end):
-    if not start:
-        return "—"
-    end = end or timezone.now()
-    minutes = int((end - start).total_seconds() // 60)
-    h = minutes // 60
-    m = minutes % 60
-    return f"{h}h {m}m"
+def _user_changed(user_id):
+    """Drop per-process caches keyed on a user after an admin created / changed / deleted it."""
+    invalidate_user_name(user_id)
+    invalidate_cached_user(user_id)
+
+
+# -------------------------------------------------------------
+# BEACON BODY helper
+# -------------------------------------------------------------
+
+# navigator.sendBeacon posts a Blob, which arrives as text/plain JSON; older
+# clients send a form-encoded body. Beacons only carry a token and a logout
+# time, so anything bigger than this is refused unread.
+BEACON_MAX_BYTES = 8192
+
+
+def _beacon_body(request):
+    """
+    Parse a beacon body into a dict, whatever its content type.
+
+    Returns None when the body is over BEACON_MAX_BYTES.
+    """
+    try:
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        length = 0
+    if length > BEACON_MAX_BYTES:
+        return None
+
+    raw = request.body
+    if not raw:
+        return {}
+    if len(raw) > BEACON_MAX_BYTES:
+        return None
+
+    # sniff the payload itself: sendBeacon's content type says nothing useful
+    if raw[:1] == b"{" or raw.lstrip()[:1] == b"{":
+        try:
+            body = json.loads(raw)
+        except ValueError:
+            return {}
+        return body if isinstance(body, dict) else {}
+
+    try:
+        text = raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return {}
+    if "=" in text:
+        body = {}
+        for k, v in parse_qsl(text):
+            body.setdefault(k, v)
+        return body
+    return {}
 
 
 # -------------------------------------------------------------
@@ -108,88 +176,82 @@ def _authenticate_any(request, body):
     if not token_value:
         return None, "none"
 
-    # Try JWT first
-    try:
-        jwt = JWTAuthentication()
-        validated = jwt.get_validated_token(token_value)
-        user = jwt.get_user(validated)
-        return user, "jwt_token"
-    except Exception:
-        pass
-
-    # Try DRF Token model
-    try:
-        tok = TokenAuthentication()
-        # authenticate_credentials expects the token string (not bytes)
-        user, _ = tok.authenticate_credentials(token_value)
-        return user, "drf_token"
-    except Exception:
-        pass
-
-    return None, "none"
+    return authenticate_token(token_value)
 
 
 # -------------------------------------------------------------
 # START ATTENDANCE
 # -------------------------------------------------------------
+#
+# The hot endpoints are split in two: a plain function holding the logic
+# (returns the JSON payload and the status code) and the view that
+# authenticates and wraps it. async_views.py serves the same functions
+# under ASGI.
 
 
-class StartAttendanceView(APIView):
-    permission_classes = [IsAuthenticated]
-
-    def post(self, request):
-        user = request.user
-        logger.info("StartAttendance user_id=%s", user.id)
+@retry_on_locked
+def _start_attendance(user):
+    logger.info("StartAttendance user_id=%s", user.id)
 
+    # the active check and the insert as one unit, so two requests (even on
+    # two workers) cannot both start a session
+    with get_session_store().user_transaction(user.id):
         active = _current_active_session(user)
         if active:
-            return JsonResponse({
+            return {
                 "detail": "Already active",
                 "attendance": {
-                    "id": active["id"],
-                    "start_time": active["start_time"].isoformat(),
+                    "id": active.id,
+                    "start_time": active.start_time.isoformat(),
                     "is_active": True
                 }
-            })
+            }, 200
 
         # refresh-safe restore:
         last = _last_session(user)
-        if last and last.get("ended_by_refresh"):
+        if last and last.ended_by_refresh:
             # Restore
-            last["is_active"] = True
-            last["end_time"] = None
-            last["ended_by_refresh"] = False
-            return JsonResponse({
+            last = _save_session(user, last.replace(
+                is_active=True, end_time=None, ended_by_refresh=False,
+            ), event="restore")
+            return {
                 "detail": "Restored session after refresh",
                 "attendance": {
-                    "id": last["id"],
-                    "start_time": last["start_time"].isoformat(),
+                    "id": last.id,
+                    "start_time": last.start_time.isoformat(),
                     "is_active": True
                 }
-            })
-
-        sess = {
-            "id": str(uuid4()),
-            "start_time": timezone.now(),
-            "end_time": None,
-            "is_active": True,
-            "breaks": [],
-            "last_update": timezone.now(),
-            "ended_by_refresh": False,
-        }
-
-        with STORE_LOCK:
-            store = _get_user_store(user)
-            store["sessions"].append(sess)
+            }, 200
+
+        sess = Session(
+            id=str(uuid4()),
+            start_time=timezone.now(),
+            end_time=None,
+            is_active=True,
+            breaks=(),
+            last_update=timezone.now(),
+            ended_by_refresh=False,
+        )
 
-        return JsonResponse({
+        sess = get_session_store().add_session(user.id, sess)
+        publish_session_event(user, "start", _serialize_session(sess))
+
+        return {
             "detail": "Attendance started",
             "attendance": {
-                "id": sess["id"],
-                "start_time": sess["start_time"].isoformat(),
+                "id": sess.id,
+                "start_time": sess.start_time.isoformat(),
                 "is_active": True
             }
-        }, status=201)
+        }, 201
+
+
+class StartAttendanceView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        payload, status = _start_attendance(request.user)
+        return JsonResponse(payload, status=status)
 
 
 # -------------------------------------------------------------
@@ -197,345 +259,301 @@ class StartAttendanceView(APIView):
 # -------------------------------------------------------------
 
 
-class ToggleBreakView(APIView):
-    permission_classes = [IsAuthenticated]
-
-    def post(self, request):
-        user = request.user
-
+@retry_on_locked
+def _toggle_break(user):
+    with get_session_store().user_transaction(user.id):
         att = _current_active_session(user)
         if not att:
-            return JsonResponse({"detail": "Start attendance first"}, status=400)
+            return {"detail": "Start attendance first"}, 400
 
         now = timezone.now()
-        with STORE_LOCK:
-            # end active break?
-            for b in reversed(att["breaks"]):
-                if b.get("end_time") is None:
-                    b["end_time"] = now
-                    return JsonResponse({
-                        "detail": "Break ended",
-                        "break": {
-                            "start_time": b["start_time"].isoformat(),
-                            "end_time": b["end_time"].isoformat(),
-                        }
-                    })
-
-            # start new break
-            nb = {"start_time": now, "end_time": None}
-            att["breaks"].append(nb)
-            return JsonResponse({
-                "detail": "Break started",
-                "break": {"start_time": nb["start_time"].isoformat(), "end_time": None}
-            }, status=201)
-
+        # end active break?
+        b = att.open_break
+        if b is not None:
+            b = b.replace(end_time=now)
+            _save_session(user, att.replace(breaks=att.breaks[:-1] + (b,)), event="break_end")
+            return {
+                "detail": "Break ended",
+                "break": {
+                    "start_time": b.start_time.isoformat(),
+                    "end_time": b.end_time.isoformat(),
+                }
+            }, 200
 
-# -------------------------------------------------------------
-# END ATTENDANCE (refresh-safe)
-# -------------------------------------------------------------
+        # start new break
+        nb = Break(start_time=now, end_time=None)
+        _save_session(user, att.replace(breaks=att.breaks + (nb,)), event="break_start")
+        return {
+            "detail": "Break started",
+            "break": {"start_time": nb.start_time.isoformat(), "end_time": None}
+        }, 201
 
 
-class EndAttendanceView(APIView):
-    permission_classes = [AllowAny]
+class ToggleBreakView(APIView):
+    permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        logger.info("EndAttendance entry raw_user=%s", getattr(request.user, "id", None))
+        payload, status = _toggle_break(request.user)
+        return JsonResponse(payload, status=status)
 
-        # ---- tolerant request-body ----
-        body = {}
-        try:
-            raw = request.body.decode("utf-8") if request.body else ""
-        except Exception:
-            raw = ""
-        if raw:
-            try:
-                body = json.loads(raw)
-            except Exception:
-                from urllib.parse import parse_qs
-                try:
-                    parsed = parse_qs(raw)
-                    body = {k: v[0] if isinstance(v, list) else v for k,v in parsed.items()}
-                except:
-                    body = {}
 
-        # authenticate by any means
-        user, via = _authenticate_any(request, body)
-        if not user:
-            logger.warning("EndAttendance auth failed via=%s", via)
-            return JsonResponse({"detail": "Authentication failed"}, status=401)
+# -------------------------------------------------------------
+# END ATTENDANCE (refresh-safe)
+# -------------------------------------------------------------
 
-        # log success path for diagnostics
-        logger.debug("EndAttendance authenticated via=%s user_id=%s", via, user.id)
 
+@retry_on_locked
+def _end_attendance(user, body):
+    with get_session_store().user_transaction(user.id):
         att = _current_active_session(user)
         if not att:
-            return JsonResponse({"detail": "No active attendance"}, status=200)
+            return {"detail": "No active attendance"}, 200
 
         now = timezone.now()
-        time_gap_ms = (now - att.get("last_update", att["start_time"])).total_seconds() * 1000
+        time_gap_ms = (now - (att.last_update or att.start_time)).total_seconds() * 1000
 
         # REFRESH-SAFE LOGIC:
         if time_gap_ms < REFRESH_GRACE_MS:
-            att["ended_by_refresh"] = True
-            att["is_active"] = False
-            att["end_time"] = now
-            att["last_update"] = now
-            return JsonResponse({"detail": "Temporary refresh end"}, status=200)
+            _save_session(user, att.replace(
+                ended_by_refresh=True, is_active=False, end_time=now, last_update=now,
+            ), event="refresh_end")
+            return {"detail": "Temporary refresh end"}, 200
 
         # NORMAL END:
-        with STORE_LOCK:
-            # End break
-            for b in att["breaks"]:
-                if b.get("end_time") is None:
-                    b["end_time"] = now
-
-            # logout_time if provided
-            logout_iso = body.get("logout_time")
-            if logout_iso:
-                try:
-                    # parse ISO timestamp robustly and make timezone-aware
-                    dt = datetime.fromisoformat(logout_iso)
-                    if dt.tzinfo is None:
-                        # assume client sends UTC (adjust if your client uses local timezone)
-                        dt = timezone.make_aware(dt, timezone.utc)
-                    att["end_time"] = dt
-                except Exception:
-                    att["end_time"] = now
-            else:
-                att["end_time"] = now
-
-            att["is_active"] = False
-            att["last_update"] = now
-            att["ended_by_refresh"] = False
-
-        # Save CSV
-        try:
-            date = att["end_time"].date()
-            _save_csv_user_date(date)
-        except Exception:
-            logger.exception("CSV save failed for user_id=%s", user.id)
+        # End break
+        att = att.close_breaks(now)
 
-        return JsonResponse({
-            "detail": "Attendance ended",
-            "attendance": {
-                "id": att["id"],
-                "start_time": att["start_time"].isoformat(),
-                "end_time": att["end_time"].isoformat(),
-                "is_active": False,
-                "breaks": [
-                    {
-                        "start_time": b["start_time"].isoformat(),
-                        "end_time": b["end_time"].isoformat() if b["end_time"] else None,
-                    }
-                    for b in att["breaks"]
-                ]
-            }
-        })
+        # logout_time if provided
+        end_time = now
+        logout_iso = body.get("logout_time")
+        if logout_iso:
+            try:
+                # parse ISO timestamp robustly and make timezone-aware
+                dt = datetime.fromisoformat(logout_iso)
+                if dt.tzinfo is None:
+                    # assume client sends UTC (adjust if your client uses local timezone)
+                    dt = timezone.make_aware(dt, timezone.utc)
+                end_time = dt
+            except Exception:
+                end_time = now
 
+        att = _save_session(user, att.replace(
+            end_time=end_time, is_active=False, last_update=now, ended_by_refresh=False,
+        ), event="end")
 
-# ---- add this after EndAttendanceView in attendance/views.py ----
+    # Save CSV (written by the background export queue)
+    try:
+        queue_session(user, att)
+    except Exception:
+        logger.exception("CSV save failed for user_id=%s", user.id)
 
-class ReviveAttendanceView(APIView):
-    """
-    Revive a recently ended session that was marked ended_by_refresh.
-    Client calls this on quick reloads; server revives only if last end was within REFRESH_GRACE_MS.
-    """
+    return {
+        "detail": "Attendance ended",
+        "attendance": _serialize_session(att)
+    }, 200
+
+
+class EndAttendanceView(APIView):
     permission_classes = [AllowAny]
 
     def post(self, request):
-        # tolerant body parsing (token may be in body)
-        body = {}
-        try:
-            raw = request.body.decode('utf-8') if request.body else ''
-        except Exception:
-            raw = ''
-        if raw:
-            try:
-                body = json.loads(raw)
-            except Exception:
-                from urllib.parse import parse_qs
-                try:
-                    parsed = parse_qs(raw)
-                    body = {k: v[0] if isinstance(v, list) else v for k, v in parsed.items()}
-                except Exception:
-                    body = {}
+        logger.info("EndAttendance entry raw_user=%s", getattr(request.user, "id", None))
+
+        # ---- tolerant request-body ----
+        body = _beacon_body(request)
+        if body is None:
+            return JsonResponse({"detail": "Request body too large"}, status=413)
 
+        # authenticate by any means
         user, via = _authenticate_any(request, body)
         if not user:
-            logger.warning("ReviveAttendance auth failed via=%s", via)
+            logger.warning("EndAttendance auth failed via=%s", via)
             return JsonResponse({"detail": "Authentication failed"}, status=401)
 
+        # log success path for diagnostics
+        logger.debug("EndAttendance authenticated via=%s user_id=%s", via, user.id)
+
+        payload, status = _end_attendance(user, body)
+        return JsonResponse(payload, status=status)
+
+
+# ---- add this after EndAttendanceView in attendance/views.py ----
+
+@retry_on_locked
+def _revive_attendance(user):
+    with get_session_store().user_transaction(user.id):
         # If already active, nothing to do
         att = _current_active_session(user)
         if att:
-            return JsonResponse({"detail": "Already active"}, status=200)
+            return {"detail": "Already active"}, 200
 
         last = _last_session(user)
         if not last:
-            return JsonResponse({"detail": "No recent session"}, status=200)
+            return {"detail": "No recent session"}, 200
 
         # Only revive sessions that were marked ended_by_refresh
-        if not last.get("ended_by_refresh"):
-            return JsonResponse({"detail": "Not ended by refresh"}, status=200)
+        if not last.ended_by_refresh:
+            return {"detail": "Not ended by refresh"}, 200
 
         now = timezone.now()
-        gap_ms = (now - last.get("last_update", last.get("end_time", now))).total_seconds() * 1000
+        gap_ms = (now - (last.last_update or last.end_time or now)).total_seconds() * 1000
 
         if gap_ms <= REFRESH_GRACE_MS:
-            with STORE_LOCK:
-                last["is_active"] = True
-                last["end_time"] = None
-                last["ended_by_refresh"] = False
-                last["last_update"] = now
-            logger.info("Revived attendance for user_id=%s session_id=%s (gap_ms=%s)", user.id, last.get("id"), int(gap_ms))
-            return JsonResponse({
+            last = _save_session(user, last.replace(
+                is_active=True, end_time=None, ended_by_refresh=False, last_update=now,
+            ), event="revive")
+            logger.info("Revived attendance for user_id=%s session_id=%s (gap_ms=%s)", user.id, last.id, int(gap_ms))
+            return {
                 "detail": "Revived",
                 "attendance": {
-                    "id": last["id"],
-                    "start_time": last["start_time"].isoformat(),
+                    "id": last.id,
+                    "start_time": last.start_time.isoformat(),
                     "is_active": True
                 }
-            }, status=200)
+            }, 200
         else:
             logger.info("Revive attempt too old for user_id=%s gap_ms=%s", user.id, int(gap_ms))
-            return JsonResponse({"detail": "Too old to revive"}, status=200)
+            return {"detail": "Too old to revive"}, 200
 
 
+class ReviveAttendanceView(APIView):
+    """
+    Revive a recently ended session that was marked ended_by_refresh.
+    Client calls this on quick reloads; server revives only if last end was within REFRESH_GRACE_MS.
+    """
+    permission_classes = [AllowAny]
 
-def _save_csv_user_date(date):
-    """Internal helper — re-generate CSV for given date."""
-    rows = list(_rows_for_date(date))
-    filename = f"attendance_{date}.csv"
+    def post(self, request):
+        # tolerant body parsing (token may be in body)
+        body = _beacon_body(request)
+        if body is None:
+            return JsonResponse({"detail": "Request body too large"}, status=413)
 
-    export_dir = Path(settings.CSV_EXPORT_DIR)
-    export_dir.mkdir(exist_ok=True)
+        user, via = _authenticate_any(request, body)
+        if not user:
+            logger.warning("ReviveAttendance auth failed via=%s", via)
+            return JsonResponse({"detail": "Authentication failed"}, status=401)
 
-    pathf = export_dir / filename
-    with pathf.open("w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(CSV_HEADER)
-        for r in rows:
-            w.writerow(r)
+        payload, status = _revive_attendance(user)
+        return JsonResponse(payload, status=status)
 
-    return str(pathf)
 
+# -------------------------------------------------------------
+# CURRENT STATUS
+# -------------------------------------------------------------
 
-def _rows_for_date(date):
-    with STORE_LOCK:
-        snapshot = copy.deepcopy(ATTENDANCE_STORE)
 
-    for uid, data in snapshot.items():
-        # uid stored as string keys
-        try:
-            user_id = int(uid)
-        except Exception:
-            user_id = None
+def _attendance_status(user):
+    # records are immutable: hold the lock only to read a consistent pair
+    with user_lock(user.id):
+        active = _current_active_session(user)
+        last = _last_session(user)
 
-        u = User.objects.filter(id=user_id).first() if user_id is not None else None
-        username = u.username if u else f"user_{uid}"
-        full_name = u.get_full_name() if u else ""
+    return {
+        "active_attendance": _serialize_session(active),
+        "last_attendance": _serialize_session(last)
+    }, 200
 
-        for s in data["sessions"]:
-            st = s["start_time"]
-            if not st or st.date() != date:
-                continue
-            et = s["end_time"]
-            status = "Active" if s["is_active"] else "Completed"
 
-            try:
-                st_local = st.astimezone(timezone.get_current_timezone())
-                st_txt = st_local.strftime("%d %b %Y, %I:%M %p")
-            except Exception:
-                st_txt = st.strftime("%d %b %Y, %I:%M %p")
-
-            if et:
-                try:
-                    et_local = et.astimezone(timezone.get_current_timezone())
-                    et_txt = et_local.strftime("%d %b %Y, %I:%M %p")
-                except Exception:
-                    et_txt = et.strftime("%d %b %Y, %I:%M %p")
-            else:
-                et_txt = "—"
-
-            br_lines = []
-            for b in s["breaks"]:
-                bs = b["start_time"]
-                be = b["end_time"]
-                try:
-                    bs_t = bs.astimezone(timezone.get_current_timezone()).strftime("%I:%M %p")
-                except Exception:
-                    bs_t = bs.strftime("%I:%M %p")
-                try:
-                    be_t = be.astimezone(timezone.get_current_timezone()).strftime("%I:%M %p") if be else "—"
-                except Exception:
-                    be_t = be.strftime("%I:%M %p") if be else "—"
-                br_lines.append(f"{bs_t} → {be_t}")
-
-            yield [
-                username, full_name,
-                st_txt, et_txt,
-                status,
-                _duration_text(st, et),
-                len(s["breaks"]),
-                "\n".join(br_lines)
-            ]
+class CurrentStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        payload, status = _attendance_status(request.user)
+        return JsonResponse(payload, status=status)
 
 
 # -------------------------------------------------------------
-# CURRENT STATUS
+# LIVE EVENTS (Server-Sent Events)
 # -------------------------------------------------------------
 
+# comment line sent when nothing happened for this long, keeps proxies from
+# closing the connection and notices clients that went away
+SSE_HEARTBEAT_SECONDS = 15
 
-class CurrentStatusView(APIView):
-    permission_classes = [IsAuthenticated]
 
-    def get(self, request):
-        user = request.user
-        active = _current_active_session(user)
-        last = _last_session(user)
+class EventsTokenView(APIView):
+    """
+    Grant for the events/ stream.
 
-        def ser(s):
-            if not s:
-                return None
-            return {
-                "id": s["id"],
-                "start_time": s["start_time"].isoformat(),
-                "end_time": s["end_time"].isoformat() if s.get("end_time") else None,
-                "is_active": s.get("is_active"),
-                "breaks": [
-                    {
-                        "start_time": b["start_time"].isoformat(),
-                        "end_time": b["end_time"].isoformat() if b["end_time"] else None,
-                    }
-                    for b in s["breaks"]
-                ]
-            }
+    "live" is false when the app runs under WSGI, where events/ is not
+    served; otherwise "token" is a stream token valid for "expires_in"
+    seconds, to pass as events/?token=.
+    """
+    permission_classes = [IsAuthenticated]
 
+    def post(self, request):
+        if not isinstance(request._request, ASGIRequest):
+            return JsonResponse({"live": False})
         return JsonResponse({
-            "active_attendance": ser(active),
-            "last_attendance": ser(last)
+            "live": True,
+            "token": issue_stream_token(request.user),
+            "expires_in": stream_token_max_age(),
         })
 
 
+class AttendanceEventsView(View):
+    """
+    text/event-stream of session events (see events.py).
+
+    EventSource cannot send headers, so a stream token from events/token/
+    comes as ?token=. Everyone gets their own events; ?scope=all gives
+    admins every user's. Only served under ASGI: a WSGI worker would be
+    held for as long as the client stays connected, so there the answer is
+    204, which tells EventSource to stop reconnecting.
+    """
+
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            return HttpResponse(status=204)
+
+        user_id = stream_token_user_id(request.GET.get("token"))
+        user = await User.objects.filter(pk=user_id, is_active=True).afirst() if user_id else None
+        if not user:
+            return JsonResponse({"detail": "Authentication failed"}, status=401)
+
+        if request.GET.get("scope") == "all":
+            if not user.is_staff:
+                return JsonResponse({"detail": "Admins only"}, status=403)
+            channels = (ADMIN_CHANNEL,)
+        else:
+            channels = (user_channel(user.id),)
+
+        resp = StreamingHttpResponse(self._stream(AsyncSubscription(channels)), content_type="text/event-stream")
+        resp["Cache-Control"] = "no-cache"
+        resp["X-Accel-Buffering"] = "no"
+        return resp
+
+    async def _stream(self, sub):
+        EVENT_BUS.subscribe(sub)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = await sub.get(SSE_HEARTBEAT_SECONDS)
+                yield format_sse(event) if event is not None else ": ping\n\n"
+        finally:
+            EVENT_BUS.unsubscribe(sub)
+
+
 # -------------------------------------------------------------
 # CSV EXPORT VIEWS (unchanged)
 # -------------------------------------------------------------
 
 
+def _csv_response(request, dates, filename):
+    # request is DRF's wrapper around the Django one
+    chunks = aiter_csv(dates) if isinstance(request._request, ASGIRequest) else iter_csv(dates)
+    res = StreamingHttpResponse(chunks, content_type="text/csv")
+    res["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return res
+
+
 class DailyCSVExportView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
         date = timezone.now().date()
-        rows = list(_rows_for_date(date))
-
-        res = HttpResponse(content_type="text/csv")
-        res["Content-Disposition"] = f'attachment; filename="attendance_{date}.csv"'
-        w = csv.writer(res)
-        w.writerow(CSV_HEADER)
-        for r in rows:
-            w.writerow(r)
-        return res
+        return _csv_response(request, [date], f"attendance_{date}.csv")
 
 
 class CSVExportByDateView(APIView):
@@ -547,14 +565,28 @@ class CSVExportByDateView(APIView):
         except Exception:
             return JsonResponse({"detail": "Invalid date"}, status=400)
 
-        rows = list(_rows_for_date(date))
-        res = HttpResponse(content_type="text/csv")
-        res["Content-Disposition"] = f'attachment; filename="attendance_{date}.csv"'
-        w = csv.writer(res)
-        w.writerow(CSV_HEADER)
-        for r in rows:
-            w.writerow(r)
-        return res
+        return _csv_response(request, [date], f"attendance_{date}.csv")
+
+
+class CSVExportRangeView(APIView):
+    """One CSV for every day from ``start`` to ``end`` (inclusive), streamed."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, start, end):
+        try:
+            start = datetime.strptime(start, "%Y-%m-%d").date()
+            end = datetime.strptime(end, "%Y-%m-%d").date()
+        except ValueError:
+            return JsonResponse({"detail": "Invalid date"}, status=400)
+
+        days = (end - start).days + 1
+        if days < 1:
+            return JsonResponse({"detail": "start must not be after end"}, status=400)
+        if days > EXPORT_RANGE_MAX_DAYS:
+            return JsonResponse({"detail": f"range too long (max {EXPORT_RANGE_MAX_DAYS} days)"}, status=400)
+
+        dates = (start + timedelta(days=i) for i in range(days))
+        return _csv_response(request, dates, f"attendance_{start}_to_{end}.csv")
 
 
 class SaveCSVToServerView(APIView):
@@ -601,6 +633,7 @@ class AdminCreateUserView(APIView):
             is_staff=d.get("is_staff", False),
             is_active=True
         )
+        _user_changed(user.id)
         return JsonResponse({"detail": "user created", "id": user.id}, status=201)
 
 
@@ -616,10 +649,11 @@ class DeleteEmployeeView(APIView):
         if t.id == request.user.id:
             return JsonResponse({"detail": "cannot delete yourself"}, status=400)
 
-        with STORE_LOCK:
-            ATTENDANCE_STORE.pop(str(t.id), None)
+        get_session_store().drop_user(t.id)
+        invalidate_csv_cache()
 
         t.delete()
+        _user_changed(user_id)
         return JsonResponse({"detail": "deleted"})
 
 
@@ -634,8 +668,8 @@ class FlushOtherUserDataView(APIView):
         if t.is_staff:
             return JsonResponse({"detail": "cannot flush admin"}, status=403)
 
-        with STORE_LOCK:
-            ATTENDANCE_STORE[str(t.id)] = {"sessions": []}
+        get_session_store().flush_user(t.id)
+        invalidate_csv_cache()
 
         return JsonResponse({"detail": "flushed"})
 
@@ -647,13 +681,14 @@ class FlushAllNonAdminDataView(APIView):
         flushed = []
         skipped = []
 
-        with STORE_LOCK:
-            for user in User.objects.filter(is_active=True):
-                if user.is_staff:
-                    skipped.append(user.id)
-                    continue
-                ATTENDANCE_STORE[str(user.id)] = {"sessions": []}
-                flushed.append(user.id)
+        store = get_session_store()
+        for user in User.objects.filter(is_active=True):
+            if user.is_staff:
+                skipped.append(user.id)
+                continue
+            store.flush_user(user.id)
+            flushed.append(user.id)
+        invalidate_csv_cache()
 
         return JsonResponse({
             "detail": "flush done",
@@ -663,26 +698,96 @@ class FlushAllNonAdminDataView(APIView):
 
 
 class EmployeeListView(APIView):
+    """
+    Active users, oldest id first, EMPLOYEE_PAGE_SIZE at a time.
+
+    ?after=<id> continues after the "next" id of the previous page and
+    ?limit=<n> picks the page size (at most EMPLOYEE_PAGE_MAX). The ETag
+    follows the user-table version, so an unchanged list revalidates as 304.
+    """
     permission_classes = [IsAuthenticated, IsAdminUser]
 
     def get(self, request):
-        users = User.objects.filter(is_active=True)
+        try:
+            after = int(request.GET.get("after", 0))
+            limit = int(request.GET.get("limit", EMPLOYEE_PAGE_SIZE))
+        except ValueError:
+            return JsonResponse({"detail": "after and limit must be integers"}, status=400)
+        limit = max(1, min(limit, EMPLOYEE_PAGE_MAX))
+
+        etag = f'W/"users-{user_table_version()}-{after}-{limit}"'
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            resp = HttpResponseNotModified()
+            resp["ETag"] = etag
+            return resp
+
+        rows = list(
+            User.objects.filter(is_active=True, id__gt=after)
+            .order_by("id")
+            .values("id", "username", "first_name", "last_name", "email", "is_staff")[:limit + 1]
+        )
+        more = len(rows) > limit
+        rows = rows[:limit]
+
+        resp = JsonResponse({
+            "employees": rows,
+            "next": rows[-1]["id"] if more else None,
+        })
+        resp["ETag"] = etag
+        # let the browser keep the body but always revalidate it
+        resp["Cache-Control"] = "private, no-cache"
+        return resp
+
+
+class EmployeeStatusView(APIView):
+    """Live status of every active user in one call, from the store's roster."""
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        roster = get_session_store().roster()
+        now = timezone.now()
+
+        employees = []
+        for u in User.objects.filter(is_active=True).order_by("id").values(
+            "id", "username", "first_name", "last_name", "is_staff"
+        ):
+            sess = roster.get(str(u["id"]))
+            u["clocked_in"] = sess is not None
+            u["on_break"] = sess is not None and sess.open_break is not None
+            u["session_start"] = sess.start_time.isoformat() if sess else None
+            u["worked_minutes"] = int(sess.worked_time(now).total_seconds() // 60) if sess else 0
+            employees.append(u)
+
         return JsonResponse({
-            "employees": [
-                {
-                    "id": u.id,
-                    "username": u.username,
-                    "first_name": u.first_name,
-                    "last_name": u.last_name,
-                    "email": u.email,
-                    "is_staff": u.is_staff
-                }
-                for u in users
-            ]
+            "employees": employees,
+            "clocked_in": sum(1 for u in employees if u["clocked_in"]),
+            "as_of": now.isoformat(),
         })
 
 
+def _parse_bound(value, end_of_day=False):
+    """
+    ?since= / ?until= value: an ISO date or datetime, naive meaning UTC.
+
+    A bare date used as an upper bound covers that whole day.
+    """
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=dt_timezone.utc)
+    if end_of_day and len(value) == 10:
+        dt += timedelta(days=1)
+    return dt
+
+
 class EmployeeTrackingView(APIView):
+    """
+    One user's sessions, oldest first.
+
+    Without parameters the whole history is returned. ?since= and ?until=
+    (ISO date or datetime) restrict it to sessions started in that window
+    and ?limit= keeps only the newest ones; "next_cursor" then pages further
+    back (pass it as ?cursor=) and is null on the oldest page.
+    """
     permission_classes = [IsAuthenticated, IsAdminUser]
 
     def get(self, request, user_id):
@@ -690,29 +795,32 @@ class EmployeeTrackingView(APIView):
         if not user:
             return JsonResponse({"detail": "not found"}, status=404)
 
-        with STORE_LOCK:
-            sessions = copy.deepcopy(
-                ATTENDANCE_STORE.get(str(user.id), {"sessions": []})["sessions"]
-            )
+        try:
+            since = _parse_bound(request.GET["since"]) if request.GET.get("since") else None
+            until = _parse_bound(request.GET["until"], end_of_day=True) if request.GET.get("until") else None
+            limit = int(request.GET["limit"]) if request.GET.get("limit") else None
+            cursor = from_epoch_us(int(request.GET["cursor"])) if request.GET.get("cursor") else None
+        except (ValueError, OverflowError):
+            # OverflowError: a cursor or bound past datetime's range
+            return JsonResponse({"detail": "Invalid since / until / limit / cursor"}, status=400)
+        if limit is not None:
+            limit = max(1, min(limit, TRACKING_PAGE_MAX))
+        if cursor is not None and (until is None or cursor < until):
+            until = cursor
+
+        # one extra session tells whether an older page exists
+        sessions = get_session_store().sessions_between(
+            user.id, since, until, limit + 1 if limit is not None else None
+        )
+        next_cursor = None
+        if limit is not None and len(sessions) > limit:
+            sessions = sessions[1:]
+            next_cursor = str(to_epoch_us(sessions[0].start_time))
 
         return JsonResponse({
             "user": {"id": user.id, "username": user.username},
-            "sessions": [
-                {
-                    "id": s["id"],
-                    "start_time": s["start_time"].isoformat(),
-                    "end_time": s["end_time"].isoformat() if s.get("end_time") else None,
-                    "is_active": s["is_active"],
-                    "breaks": [
-                        {
-                            "start_time": b["start_time"].isoformat(),
-                            "end_time": b["end_time"].isoformat() if b["end_time"] else None,
-                        }
-                        for b in s["breaks"]
-                    ]
-                }
-                for s in sessions
-            ]
+            "sessions": [_serialize_session(s) for s in sessions],
+            "next_cursor": next_cursor,
         })
 
 
@@ -727,6 +835,7 @@ class PromoteDemoteUserView(APIView):
         make_admin = bool(request.data.get("is_staff"))
         target.is_staff = make_admin
         target.save()
+        _user_changed(target.id)
         return JsonResponse({"detail": "updated", "is_staff": make_admin})
 
 
@@ -0,0 +1,384 @@
+# attendance/writebehind.py
+# Write-behind session store.
+#
+# WriteBehindSessionStore serves every read and write from memory, like
+# MemorySessionStore, and persists to the Attendance / BreakInterval tables
+# in the background. Each change is first appended to a journal file under
+# ATTENDANCE_JOURNAL_DIR, so a change that was acknowledged survives a
+# crashed or killed worker. A flusher thread then coalesces the pending
+# changes (the newest state of a session wins) and writes them every
+# ATTENDANCE_WRITE_BEHIND_DELAY seconds in one transaction with
+# bulk_create / bulk_update. A morning burst of logins becomes a handful of
+# SQLite commits instead of one per request.
+#
+# The journal is split in segments: the flusher closes the current one when
+# it takes a batch and deletes it once the batch is committed. Segments left
+# behind by a crash are replayed into the database when the store starts.
+# A batch that keeps failing (MAX_ATTEMPTS times) is written user by user;
+# the changes of users that still fail are moved to <journal>/failed/ and
+# logged as an error, so one bad row cannot hold back everything after it.
+#
+# The memory copy is authoritative, so run a single worker process with this
+# store (the same rule as MemorySessionStore). New sessions get their
+# Attendance primary key up front from a per-process counter.
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+
+from .models import Attendance, BreakInterval
+from .records import pack_session, unpack_session
+from .store import DatabaseSessionStore, MemorySessionStore, user_lock
+
+logger = logging.getLogger("attendance")
+
+# sessions per transaction when a large batch (or a replay) is written
+BATCH_SIZE = 500
+
+# failed writes of the same batch before it is split up and set aside
+MAX_ATTEMPTS = 5
+
+_PUT = "put"
+_FLUSH = "flush"
+
+
+# -------------------------------------------------------------
+# Applying changes to the database
+# -------------------------------------------------------------
+
+
+def _coalesce(ops):
+    """
+    Reduce a sequence of (op, uid, session) to what the database must do.
+
+    Returns (flushed uids, {uid: {session_id: newest session}}); a flush
+    cancels the user's earlier puts.
+    """
+    flushes = set()
+    puts = {}
+    for op, uid, sess in ops:
+        if op == _FLUSH:
+            flushes.add(uid)
+            puts.pop(uid, None)
+        else:
+            puts.setdefault(uid, {})[sess.id] = sess
+    return flushes, puts
+
+
+def _attendance_row(uid, s):
+    return Attendance(
+        pk=int(s.id),
+        user_id=int(uid),
+        start_time=s.start_time,
+        end_time=s.end_time,
+        is_active=s.is_active,
+        last_update=s.last_update,
+        ended_by_refresh=s.ended_by_refresh,
+    )
+
+
+def _write_sessions(sessions):
+    """Insert or update ``sessions`` [(uid, session), ...] and their breaks (inside a transaction)."""
+    pks = [int(s.id) for _, s in sessions]
+    existing = set(Attendance.objects.filter(pk__in=pks).values_list("pk", flat=True))
+
+    rows = [_attendance_row(uid, s) for uid, s in sessions]
+    Attendance.objects.bulk_create([a for a in rows if a.pk not in existing])
+    Attendance.objects.bulk_update(
+        [a for a in rows if a.pk in existing],
+        ["end_time", "is_active", "last_update", "ended_by_refresh"],
+    )
+
+    # breaks are append-only and ordered, so match them up by position
+    stored = {}
+    for b in BreakInterval.objects.filter(attendance_id__in=existing).order_by("start_time", "id"):
+        stored.setdefault(b.attendance_id, []).append(b)
+    changed, new = [], []
+    for _, s in sessions:
+        pk = int(s.id)
+        have = stored.get(pk, [])
+        for row, b in zip(have, s.breaks):
+            if row.end_time != b.end_time:
+                row.end_time = b.end_time
+                row.is_active = b.end_time is None
+                changed.append(row)
+        new.extend(
+            BreakInterval(attendance_id=pk, start_time=b.start_time, end_time=b.end_time,
+                          is_active=b.end_time is None)
+            for b in s.breaks[len(have):]
+        )
+    BreakInterval.objects.bulk_update(changed, ["end_time", "is_active"])
+    BreakInterval.objects.bulk_create(new)
+
+
+def apply_ops(ops):
+    """Write a batch of journal operations to the database."""
+    flushes, puts = _coalesce(ops)
+    # a user deleted meanwhile took their rows with them (CASCADE)
+    live = set(User.objects.filter(pk__in=[int(u) for u in puts]).values_list("pk", flat=True))
+    sessions = [
+        (uid, s) for uid, by_id in puts.items() if int(uid) in live for s in by_id.values()
+    ]
+
+    with transaction.atomic():
+        if flushes:
+            Attendance.objects.filter(user_id__in=[int(u) for u in flushes]).delete()
+        for i in range(0, len(sessions), BATCH_SIZE):
+            _write_sessions(sessions[i:i + BATCH_SIZE])
+    return len(sessions)
+
+
+# -------------------------------------------------------------
+# Journal
+# -------------------------------------------------------------
+
+
+def _encode_op(op, uid, sess):
+    data = {"op": op, "u": uid}
+    if sess is not None:
+        data["s"] = pack_session(sess)
+    return json.dumps(data, separators=(",", ":")) + "\n"
+
+
+def read_segment(path):
+    """The operations in one journal segment; a torn last line (crash mid-write) is skipped."""
+    ops = []
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            try:
+                data = json.loads(line)
+            except ValueError:
+                logger.warning("Skipping unreadable journal line %s:%d", path, n)
+                continue
+            sess = unpack_session(data["s"]) if "s" in data else None
+            ops.append((data["op"], data["u"], sess))
+    return ops
+
+
+class WriteBehindJournal:
+    """
+    Append-only journal plus the background flusher.
+
+    append() writes the operation to the open segment before returning; the
+    flusher thread starts on first use, batches everything appended within
+    ``delay`` seconds and deletes the segments once the batch is committed.
+    """
+
+    def __init__(self, directory, delay, fsync=False):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.delay = delay
+        self.fsync = fsync
+        self._cond = threading.Condition()
+        self._ops = []
+        self._closed = []  # segments whose operations are all in self._ops
+        self._due = None
+        self._attempts = 0  # consecutive failures of the batch at the head
+        self._thread = None
+        self._seq = max((int(p.stem) for p in self.segments()), default=0)
+        self._file = None
+        self._path = None
+        self.appended = 0
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+
+    def segments(self):
+        """Segment files on disk, oldest first."""
+        return sorted(self.directory.glob("*.log"), key=lambda p: int(p.stem))
+
+    def _open(self):
+        self._seq += 1
+        self._path = self.directory / f"{self._seq:012d}.log"
+        self._file = open(self._path, "a", encoding="utf-8")
+
+    def append(self, op, uid, sess=None):
+        line = _encode_op(op, str(uid), sess)
+        with self._cond:
+            if self._file is None:
+                self._open()
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._ops.append((op, str(uid), sess))
+            self.appended += 1
+            if self._due is None:
+                self._due = time.monotonic() + self.delay
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="attendance-write-behind", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _take(self):
+        if self._file is not None:
+            self._file.close()
+            self._closed.append(self._path)
+            self._file = None
+        batch = (self._ops, self._closed)
+        self._ops, self._closed, self._due = [], [], None
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._due is None:
+                    self._cond.wait()
+                remaining = self._due - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                batch = self._take()
+            self._write(*batch)
+
+    def _write(self, ops, segments):
+        if not ops and not segments:
+            return
+        try:
+            written = apply_ops(ops)
+        except Exception:
+            with self._cond:
+                self.failed += 1
+                self._attempts += 1
+                give_up = self._attempts >= MAX_ATTEMPTS
+                if not give_up:
+                    logger.exception("Write-behind batch of %d change(s) failed, retrying", len(ops))
+                    # keep them (and their segments) ahead of anything newer
+                    self._ops = ops + self._ops
+                    self._closed = segments + self._closed
+                    if self._due is None:
+                        self._due = time.monotonic() + max(self.delay, 1.0)
+                    self._cond.notify()
+                    return
+                self._attempts = 0
+            written = self._set_aside(ops)
+        else:
+            with self._cond:
+                self._attempts = 0
+        for path in segments:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        with self._cond:
+            self.written += written
+            self.batches += 1
+
+    def _set_aside(self, ops):
+        """Write ``ops`` one user at a time; keep the users that still fail in failed/."""
+        by_user = {}
+        for op in ops:
+            by_user.setdefault(op[1], []).append(op)
+        written = 0
+        stuck = []
+        for uid, user_ops in by_user.items():
+            try:
+                written += apply_ops(user_ops)
+            except Exception:
+                logger.exception("Write-behind changes of user_id=%s failed %d times", uid, MAX_ATTEMPTS)
+                stuck.extend(user_ops)
+        if stuck:
+            failed = self.directory / "failed"
+            failed.mkdir(exist_ok=True)
+            path = failed / f"{time.time_ns()}.log"
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(_encode_op(op, uid, sess) for op, uid, sess in stuck)
+                f.flush()
+                os.fsync(f.fileno())
+            logger.error("Write-behind gave up on %d change(s); they are kept in %s", len(stuck), path)
+        return written
+
+    def flush(self):
+        """Write everything pending now, on the calling thread."""
+        with self._cond:
+            batch = self._take()
+        self._write(*batch)
+
+    def replay(self):
+        """Apply segments left on disk by an earlier process; returns the number of operations."""
+        count = 0
+        for path in self.segments():
+            ops = read_segment(path)
+            apply_ops(ops)
+            path.unlink()
+            count += len(ops)
+        return count
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pending": len(self._ops),
+                "appended": self.appended,
+                "written": self.written,
+                "batches": self.batches,
+                "failed": self.failed,
+            }
+
+
+# -------------------------------------------------------------
+# Store
+# -------------------------------------------------------------
+
+
+class WriteBehindSessionStore(MemorySessionStore):
+    """
+    Sessions live in memory and reach the database through the journal.
+
+    On creation the store replays any journal segments left on disk, then
+    loads every session from the database.
+    """
+
+    # appends to the journal and loads from the database on first use
+    blocking = True
+
+    def __init__(self):
+        self.journal = WriteBehindJournal(
+            getattr(settings, "ATTENDANCE_JOURNAL_DIR", Path(settings.BASE_DIR) / "journal"),
+            getattr(settings, "ATTENDANCE_WRITE_BEHIND_DELAY", 0.25),
+            fsync=getattr(settings, "ATTENDANCE_JOURNAL_FSYNC", False),
+        )
+        replayed = self.journal.replay()
+        if replayed:
+            logger.info("Replayed %d journaled change(s) into the database", replayed)
+
+        for uid, entry in DatabaseSessionStore().snapshot().items():
+            self.load_user(uid, entry["sessions"])
+
+        self._pk_lock = threading.Lock()
+        self._last_pk = Attendance.objects.aggregate(m=Max("pk"))["m"] or 0
+        atexit.register(self.journal.flush)
+
+    def _new_pk(self):
+        with self._pk_lock:
+            self._last_pk += 1
+            return self._last_pk
+
+    def add_session(self, user_id, sess):
+        sess = sess.replace(id=str(self._new_pk()))
+        with user_lock(user_id):
+            self.journal.append(_PUT, user_id, sess)
+            return super().add_session(user_id, sess)
+
+    def save_session(self, user_id, sess):
+        with user_lock(user_id):
+            self.journal.append(_PUT, user_id, sess)
+            return super().save_session(user_id, sess)
+
+    def flush_user(self, user_id):
+        with user_lock(user_id):
+            self.journal.append(_FLUSH, user_id)
+            super().flush_user(user_id)
+
+    def drop_user(self, user_id):
+        with user_lock(user_id):
+            self.journal.append(_FLUSH, user_id)
+            super().drop_user(user_id)
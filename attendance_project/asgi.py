@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'attendance_project.settings')
+# async-native attendance endpoints when served over ASGI (set to 0 to opt out)
+os.environ.setdefault('ATTENDANCE_ASYNC_VIEWS', '1')
+# Django does not support persistent connections under ASGI
+os.environ.setdefault('ATTENDANCE_DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -78,9 +78,57 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # keep connections (and their pragmas) across requests; asgi.py sets 0
+        'CONN_MAX_AGE': int(os.environ.get('ATTENDANCE_DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # seconds a connection waits for the write lock (SQLite's busy
+            # timeout); the only place it is set, a busy_timeout pragma
+            # in ATTENDANCE_SQLITE_PRAGMAS would override it
+            'timeout': 5,
+            # take the write lock at BEGIN, so a transaction never fails
+            # half-way when it upgrades from reading to writing
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Pragmas run on every new SQLite connection (attendance/sqlite.py).
+# None uses the defaults there (WAL, synchronous=NORMAL, mmap_size,
+# cache_size); {} leaves SQLite's own defaults.
+ATTENDANCE_SQLITE_PRAGMAS = None
+
+# Store writes that still find the database locked are retried this many
+# times, backing off from ATTENDANCE_SQLITE_RETRY_DELAY seconds.
+ATTENDANCE_SQLITE_WRITE_RETRIES = 3
+ATTENDANCE_SQLITE_RETRY_DELAY = 0.05
+
+# --------------------
+# Attendance session store
+# --------------------
+# DatabaseSessionStore keeps sessions on the Attendance/BreakInterval tables so
+# several gunicorn workers share them and restarts keep open sessions.
+# Use 'attendance.store.MemorySessionStore' for the old per-process dict.
+# 'attendance.writebehind.WriteBehindSessionStore' serves from memory and
+# writes to the database in batches (single worker process only).
+ATTENDANCE_SESSION_STORE = os.environ.get(
+    'ATTENDANCE_SESSION_STORE', 'attendance.store.DatabaseSessionStore'
+)
+
+# WriteBehindSessionStore: journal location, how long changes are batched
+# (seconds) and whether every journal append is fsync'ed (off: a killed
+# worker loses nothing, a power cut may lose the last changes, the same
+# guarantee as synchronous=NORMAL).
+ATTENDANCE_JOURNAL_DIR = BASE_DIR / 'journal'
+ATTENDANCE_WRITE_BEHIND_DELAY = float(os.environ.get('ATTENDANCE_WRITE_BEHIND_DELAY', '0.25'))
+ATTENDANCE_JOURNAL_FSYNC = os.environ.get('ATTENDANCE_JOURNAL_FSYNC', '0') == '1'
+
+# 'attendance.snapshots.SnapshotSessionStore' is the in-memory store with a
+# change log and a snapshot every ATTENDANCE_SNAPSHOT_INTERVAL seconds (and at
+# exit) in this directory, so a restarted worker gets its sessions back.
+ATTENDANCE_SNAPSHOT_DIR = BASE_DIR / 'store_snapshots'
+ATTENDANCE_SNAPSHOT_INTERVAL = float(os.environ.get('ATTENDANCE_SNAPSHOT_INTERVAL', '300'))
+
 # --------------------
 # Password validation
 # --------------------
@@ -99,7 +147,18 @@ USE_TZ = True
 # --------------------
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# STATICFILES_STORAGE is no longer read by Django 5.1+, hence STORAGES.
+# collectstatic minifies the dashboard CSS/JS, fingerprints every file and
+# writes .gz/.br variants; WhiteNoise serves the fingerprinted names with
+# immutable far-future caching, so repeat page loads fetch no assets.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'attendance.storage.MinifiedStaticFilesStorage',
+    },
+}
 
 # --------------------
 # CSV directory (ensure exists, create parents)
@@ -111,6 +170,18 @@ except Exception:
     # If creation fails, continue — write attempts will raise later and appear in logs
     pass
 
+# Ended sessions are written to the day CSV by a background thread, batched
+# per date, at most this many seconds later. 0 writes inline in the request.
+ATTENDANCE_EXPORT_DELAY = float(os.environ.get('ATTENDANCE_EXPORT_DELAY', '2.0'))
+
+# Serve start/, break/toggle/, end/, status/ and revive_if_recent/ with the
+# async views (attendance/async_views.py). asgi.py turns this on.
+ATTENDANCE_ASYNC_VIEWS = os.environ.get('ATTENDANCE_ASYNC_VIEWS', '0') == '1'
+
+# Seconds a stream token from events/token/ can be used to open events/
+# (the live-update stream, ASGI only).
+ATTENDANCE_EVENTS_TOKEN_MAX_AGE = 60
+
 # --------------------
 # Logging (console + rotating file for 'attendance' logger)
 # --------------------
@@ -164,10 +235,23 @@ LOGGING = {
 # --------------------
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'attendance.authentication.CachedJWTAuthentication',
     ),
 }
 
+# Seconds an authenticated user is reused without reloading it (0 disables the cache).
+# The cache is per process: an admin's change to a user (demotion, deletion)
+# reaches the other workers only when their entry expires, so this is also
+# how long a multi-worker deployment may act on the old user.
+ATTENDANCE_AUTH_CACHE_TTL = float(os.environ.get('ATTENDANCE_AUTH_CACHE_TTL', '5'))
+ATTENDANCE_AUTH_CACHE_SIZE = 1024
+
+# Beacon endpoints (end/, revive_if_recent/): backends tried for body/header
+# tokens (None = JWT, plus DRF tokens if rest_framework.authtoken is installed)
+# and how long a rejected token is turned away without checking it again.
+ATTENDANCE_BEACON_AUTH_BACKENDS = None
+ATTENDANCE_BEACON_REJECT_TTL = 60.0
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=8),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
@@ -0,0 +1,61 @@
+# benchmarks/common.py
+# Shared setup for the benchmark scripts.
+
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+# the fixture database: 50 users ("u0".."u49") with 30 days x 4 finished
+# sessions each (3,000 of them with a break) plus one open session each,
+# and 5,000 users ("bulk0".."bulk4999") without sessions
+SEED_USERS = 50
+SEED_DAYS = 30
+SEED_BULK_USERS = 5000
+
+
+def setup(**env):
+    """Configure Django on benchmarks/settings.py; ``env`` is put in os.environ first."""
+    for name, value in env.items():
+        os.environ[name] = str(value)
+    os.environ["DJANGO_SETTINGS_MODULE"] = "benchmarks.settings"
+    import django
+    django.setup()
+
+
+def seed_database():
+    """Migrate the scratch database and fill it with the fixture unless that was done before."""
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from attendance.models import Attendance, BreakInterval
+
+    call_command("migrate", verbosity=0)
+    if User.objects.filter(username="u0").exists():
+        return
+
+    users = User.objects.bulk_create([
+        User(username=f"u{i}", first_name="F", last_name=str(i)) for i in range(SEED_USERS)
+    ])
+    base = datetime(2025, 1, 1, 8, tzinfo=dt_timezone.utc)
+    rows = [
+        Attendance(user=u, start_time=start, end_time=start + timedelta(hours=1), is_active=False, last_update=start)
+        for d in range(SEED_DAYS) for u in users for k in range(4)
+        for start in [base + timedelta(days=d, hours=k * 2)]
+    ]
+    now = datetime.now(dt_timezone.utc)
+    rows += [Attendance(user=u, start_time=now, is_active=True, last_update=now) for u in users]
+    Attendance.objects.bulk_create(rows, batch_size=2000)
+    BreakInterval.objects.bulk_create([
+        BreakInterval(attendance=a, start_time=a.start_time + timedelta(minutes=10),
+                      end_time=a.start_time + timedelta(minutes=20), is_active=False)
+        for a in Attendance.objects.filter(is_active=False).order_by("id")[:3000]
+    ], batch_size=2000)
+    User.objects.bulk_create([User(username=f"bulk{i}") for i in range(SEED_BULK_USERS)], batch_size=2000)
+
+
+def latency_summary(seconds):
+    """"p50 x ms, p99 y ms" for a list of durations in seconds."""
+    seconds = sorted(seconds)
+
+    def pick(q):
+        return seconds[min(len(seconds) - 1, int(len(seconds) * q))] * 1000
+
+    return f"p50 {pick(0.50):.2f} ms, p99 {pick(0.99):.2f} ms"
@@ -0,0 +1,96 @@
+# benchmarks/contention.py
+# Store lock contention (striped per-user locks).
+#
+# A memory store with 2,000 users x 20 sessions; one admin thread takes
+# snapshots in a loop while 8 employee threads each start and end a session
+# 300 times. Prints the employees' latency and the wall time.
+#
+#   python -m benchmarks.contention            # striped locks (current)
+#   python -m benchmarks.contention --global   # one lock + deep-copied snapshots, as before
+#
+# The global mode takes minutes; --users / --cycles shrink the run.
+#
+# The global mode puts every user on one lock and makes snapshot() deep-copy
+# the whole store under it, which is what the store did before the stripes.
+
+import argparse
+import copy
+import threading
+import time
+from datetime import timedelta
+
+from .common import latency_summary, setup
+
+USERS = 2000
+SESSIONS = 20
+EMPLOYEES = 8
+CYCLES = 300
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--global", dest="global_lock", action="store_true")
+    parser.add_argument("--users", type=int, default=USERS)
+    parser.add_argument("--cycles", type=int, default=CYCLES)
+    args = parser.parse_args()
+
+    setup(ATTENDANCE_SESSION_STORE="attendance.store.MemorySessionStore")
+    from django.utils import timezone
+    from attendance import store as st
+    from attendance.records import Break, Session
+
+    store = st.get_session_store()
+    lock = None
+    if args.global_lock:
+        lock = threading.RLock()
+        st.user_lock = lambda user_id: lock
+        st.STORE_LOCK = lock
+
+        def snapshot():
+            with lock:
+                return copy.deepcopy(st.ATTENDANCE_STORE)
+
+        store.snapshot = snapshot
+
+    now = timezone.now()
+    for u in range(args.users):
+        store.load_user(u, [
+            Session(f"{u}-{i}", now - timedelta(days=i), now, False, (Break(now, now),), now)
+            for i in range(SESSIONS, 0, -1)
+        ])
+
+    stop = threading.Event()
+
+    def admin():
+        while not stop.is_set():
+            store.snapshot()
+
+    latencies = []
+
+    def employee(uid):
+        for i in range(args.cycles):
+            t = time.perf_counter()
+            with st.user_lock(uid):
+                sess = store.add_session(uid, Session(f"x{i}", timezone.now()))
+                store.save_session(uid, sess.replace(end_time=timezone.now(), is_active=False))
+            latencies.append(time.perf_counter() - t)
+            time.sleep(0.001)
+
+    admin_thread = threading.Thread(target=admin)
+    admin_thread.start()
+    threads = [threading.Thread(target=employee, args=(args.users + k,)) for k in range(EMPLOYEES)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    stop.set()
+    admin_thread.join()
+
+    mode = "global lock" if args.global_lock else "striped locks"
+    print(f"{mode}: {len(latencies)} start+end, {latency_summary(latencies)}, wall {wall:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# benchmarks/csv_rows.py
+# CSV row formatting (exports._session_row with a per-export _TimeFormatter).
+#
+# 100,000 sessions with two breaks each (one in 20 still open) spread over
+# 30 days, formatted in Asia/Kolkata; best of 3. The MD5 of the finished
+# rows lets two versions be checked for byte-identical output.
+#
+#   python -m benchmarks.csv_rows
+#
+# To compare with an older tree, run this file from a checkout of it; without
+# _TimeFormatter every row is formatted on its own, as it was then.
+
+import hashlib
+import random
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from .common import setup
+
+SESSIONS = 100_000
+
+
+def main():
+    setup()
+    from django.utils import timezone
+    from attendance import exports
+    from attendance.records import Break, Session
+
+    random.seed(1)
+    base = datetime(2025, 11, 1, tzinfo=dt_timezone.utc)
+    sessions = []
+    for i in range(SESSIONS):
+        start = base + timedelta(days=random.randrange(30), seconds=random.randrange(36000))
+        b1 = start + timedelta(minutes=random.randrange(60, 180))
+        b2 = b1 + timedelta(minutes=random.randrange(60, 180))
+        active = i % 20 == 0
+        sessions.append(Session(
+            str(i), start, None if active else b2 + timedelta(hours=2), active,
+            (Break(b1, b1 + timedelta(minutes=15)), Break(b2, None if active else b2 + timedelta(minutes=30))),
+            start,
+        ))
+
+    def run():
+        if hasattr(exports, "_TimeFormatter"):
+            fmt = exports._TimeFormatter()
+            return [exports._session_row("user", "Full Name", s, fmt) for s in sessions]
+        return [exports._session_row("user", "Full Name", s) for s in sessions]
+
+    with timezone.override("Asia/Kolkata"):
+        best = None
+        for _ in range(3):
+            t = time.perf_counter()
+            rows = run()
+            elapsed = time.perf_counter() - t
+            best = elapsed if best is None else min(best, elapsed)
+
+    digest = hashlib.md5(repr([r for r in rows if r[4] == "Completed"]).encode()).hexdigest()
+    print(f"{SESSIONS:,} sessions: {best:.2f} s, {SESSIONS / best:,.0f} rows/s (finished rows md5 {digest})")
+
+
+if __name__ == "__main__":
+    main()
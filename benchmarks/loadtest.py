@@ -0,0 +1,100 @@
+# benchmarks/loadtest.py
+# HTTP load test of the attendance endpoints (WSGI vs ASGI).
+#
+# Each client loops on status/ three times and break/toggle/ once for
+# --duration seconds, as one of the fixture users ("u0".."u49"). Start a
+# server on the scratch database first, e.g. with one worker:
+#
+#   python -m benchmarks.loadtest --prepare
+#   DJANGO_SETTINGS_MODULE=benchmarks.settings gunicorn attendance_project.wsgi -w 1 -b 127.0.0.1:8000
+#   DJANGO_SETTINGS_MODULE=benchmarks.settings gunicorn attendance_project.asgi:application \
+#       -k uvicorn_worker.UvicornWorker -w 1 -b 127.0.0.1:8000
+#   python -m benchmarks.loadtest --port 8000 --clients 32 --duration 10
+#
+# Add ATTENDANCE_SESSION_STORE=attendance.store.MemorySessionStore to the
+# server's environment for the memory store. --prepare seeds the database
+# and writes one access token per fixture user to BENCH_DIR/tokens.json.
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+
+from .common import latency_summary
+
+TOKENS_FILE = Path(os.environ.get("BENCH_DIR", "/tmp/attendance-bench")) / "tokens.json"
+
+
+def prepare():
+    from .common import seed_database, setup
+    setup()
+    seed_database()
+    from django.contrib.auth.models import User
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    users = User.objects.filter(username__regex=r"^u\d+$").order_by("id")
+    TOKENS_FILE.write_text(json.dumps([str(AccessToken.for_user(u)) for u in users]))
+    print(f"{users.count()} tokens written to {TOKENS_FILE}")
+
+
+async def request(host, port, method, path, token):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nAuthorization: Bearer {token}\r\n"
+        f"Content-Length: 0\r\nConnection: close\r\n\r\n".encode()
+    )
+    await writer.drain()
+    data = await reader.read()
+    writer.close()
+    return int(data.split(b" ", 2)[1])
+
+
+async def run(host, port, clients, duration):
+    tokens = json.loads(TOKENS_FILE.read_text())
+    # every user needs an open session for break/toggle/
+    for token in tokens:
+        await request(host, port, "POST", "/api/attendance/start/", token)
+
+    latencies = []
+    errors = 0
+
+    async def client(i, end):
+        nonlocal errors
+        token = tokens[i % len(tokens)]
+        n = 0
+        while time.perf_counter() < end:
+            method, path = ("POST", "/api/attendance/break/toggle/") if n % 4 == 3 else \
+                ("GET", "/api/attendance/status/")
+            t = time.perf_counter()
+            try:
+                if await request(host, port, method, path, token) >= 400:
+                    errors += 1
+            except OSError:
+                errors += 1
+            latencies.append(time.perf_counter() - t)
+            n += 1
+
+    end = time.perf_counter() + duration
+    await asyncio.gather(*(client(i, end) for i in range(clients)))
+    print(f"{clients} clients, {duration:.0f} s: {len(latencies) / duration:.0f} rps, "
+          f"{latency_summary(latencies)}, {errors} errors")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prepare", action="store_true")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+    if args.prepare:
+        prepare()
+    else:
+        asyncio.run(run(args.host, args.port, args.clients, args.duration))
+
+
+if __name__ == "__main__":
+    main()
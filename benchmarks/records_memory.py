@@ -0,0 +1,55 @@
+# benchmarks/records_memory.py
+# Memory per session: the __slots__ records against the old dict layout.
+#
+# Builds N sessions with one break each (uuid4 ids) and reports the bytes
+# traced by tracemalloc per session.
+#
+#   python -m benchmarks.records_memory [N ...]     # default 10000 100000 1000000
+
+import argparse
+import gc
+import tracemalloc
+from datetime import timedelta
+from uuid import uuid4
+
+from .common import setup
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sizes", nargs="*", type=int, default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    setup()
+    from django.utils import timezone
+    from attendance.records import Break, Session
+
+    base = timezone.now()
+
+    def as_dict(i):
+        st = base + timedelta(seconds=i)
+        return {
+            "id": str(uuid4()), "start_time": st, "end_time": st + timedelta(hours=8), "is_active": False,
+            "breaks": [{"start_time": st + timedelta(hours=2), "end_time": st + timedelta(hours=3)}],
+            "last_update": st + timedelta(hours=8), "ended_by_refresh": False,
+        }
+
+    def as_record(i):
+        st = base + timedelta(seconds=i)
+        return Session(str(uuid4()), st, st + timedelta(hours=8), False,
+                       (Break(st + timedelta(hours=2), st + timedelta(hours=3)),), st + timedelta(hours=8))
+
+    for n in args.sizes:
+        sizes = []
+        for build in (as_dict, as_record):
+            gc.collect()
+            tracemalloc.start()
+            data = [build(i) for i in range(n)]
+            sizes.append(tracemalloc.get_traced_memory()[0] / n)
+            tracemalloc.stop()
+            del data
+        print(f"{n:>9,} sessions: dict {sizes[0]:.0f} B, __slots__ {sizes[1]:.0f} B per session")
+
+
+if __name__ == "__main__":
+    main()
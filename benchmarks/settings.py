@@ -0,0 +1,27 @@
+# benchmarks/settings.py
+# Project settings pointed at a scratch directory (BENCH_DIR, default
+# /tmp/attendance-bench), so a benchmark never touches db.sqlite3,
+# csv_exports/, the journal or the snapshots of the real app.
+
+import os
+from pathlib import Path
+
+from attendance_project.settings import *  # noqa: F401,F403
+from attendance_project.settings import DATABASES
+
+BENCH_DIR = Path(os.environ.get("BENCH_DIR", "/tmp/attendance-bench"))
+BENCH_DIR.mkdir(parents=True, exist_ok=True)
+
+DATABASES = {"default": dict(DATABASES["default"], NAME=BENCH_DIR / "db.sqlite3")}
+CSV_EXPORT_DIR = BENCH_DIR / "csv_exports"
+ATTENDANCE_JOURNAL_DIR = BENCH_DIR / "journal"
+ATTENDANCE_SNAPSHOT_DIR = BENCH_DIR / "store_snapshots"
+ATTENDANCE_SNAPSHOT_INTERVAL = 0
+LOGGING = {"version": 1}
+
+if os.environ.get("BENCH_SQLITE_DEFAULTS") == "1":
+    # SQLite as it was before attendance/sqlite.py: rollback journal, the
+    # driver's default lock wait, no retries
+    DATABASES = {"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": BENCH_DIR / "db.sqlite3"}}
+    ATTENDANCE_SQLITE_PRAGMAS = {"journal_mode": "DELETE", "synchronous": "FULL"}
+    ATTENDANCE_SQLITE_WRITE_RETRIES = 0
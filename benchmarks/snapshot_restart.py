@@ -0,0 +1,137 @@
+# benchmarks/snapshot_restart.py
+# Warm restart of SnapshotSessionStore.
+#
+# A child process fills the store with 100,000 sessions (5,000 users x 20,
+# every third user clocked in), writes a snapshot, logs 10,000 more changes
+# and exits with os._exit (no exit snapshot). This process then starts the
+# store from the snapshot plus the log and checks the state is the same.
+#
+#   python -m benchmarks.snapshot_restart
+#   python -m benchmarks.snapshot_restart --from-db   # also time DatabaseSessionStore.snapshot()
+#
+# --from-db copies the sessions into the scratch database for that and
+# removes them again afterwards.
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from .common import setup
+
+USERS = 5000
+SESSIONS = 20
+TAIL_CHANGES = 10_000
+CHECK_USERS = (1, 2, 3, USERS - 1, USERS)
+
+
+def _state(store):
+    from attendance.records import pack_session
+    return {str(u): [pack_session(s) for s in store.user_sessions(u)] for u in CHECK_USERS}
+
+
+def fill(expected_path):
+    from attendance.records import Break, Session
+    from attendance.snapshots import SnapshotSessionStore
+
+    store = SnapshotSessionStore()
+    random.seed(1)
+    base = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+    t = time.perf_counter()
+    for u in range(1, USERS + 1):
+        for d in range(SESSIONS):
+            start = base + timedelta(days=d * 3, minutes=random.randrange(600))
+            active = d == SESSIONS - 1 and u % 3 == 0
+            b = Break(start + timedelta(hours=3), start + timedelta(hours=3, minutes=20))
+            store.add_session(u, Session(f"{u}-{d}", start, None if active else start + timedelta(hours=8),
+                                         active, (b,), start))
+    logged = time.perf_counter() - t
+
+    t = time.perf_counter()
+    path = store.save_snapshot(force=True)
+    written = time.perf_counter() - t
+
+    for i in range(TAIL_CHANGES):
+        u = i % USERS + 1
+        last = store.last_session(u)
+        store.save_session(u, last.replace(last_update=last.start_time + timedelta(minutes=i % 50 + 1)))
+
+    with open(expected_path, "w") as f:
+        json.dump(_state(store), f)
+    print(f"{USERS * SESSIONS:,} sessions logged in {logged:.2f} s; "
+          f"snapshot {written * 1000:.0f} ms, {path.stat().st_size / 1e6:.1f} MB; "
+          f"then {TAIL_CHANGES:,} changes logged")
+    sys.stdout.flush()
+    os._exit(0)  # a crash: nothing is written at exit
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--from-db", action="store_true")
+    parser.add_argument("--fill", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    expected_path = settings.BENCH_DIR / "snapshot_expected.json"
+    if args.fill:
+        fill(expected_path)
+
+    shutil.rmtree(settings.ATTENDANCE_SNAPSHOT_DIR, ignore_errors=True)
+    subprocess.run([sys.executable, "-m", "benchmarks.snapshot_restart", "--fill"], check=True)
+
+    from attendance import store as st
+    from attendance.snapshots import SnapshotSessionStore
+
+    t = time.perf_counter()
+    store = SnapshotSessionStore()
+    restarted = time.perf_counter() - t
+    with open(expected_path) as f:
+        same = json.loads(json.dumps(_state(store))) == json.load(f)
+    print(f"restart with log replay and a new snapshot: {restarted * 1000:.0f} ms, "
+          f"{len(st.ROSTER):,} clocked in, state identical: {same}")
+
+    t = time.perf_counter()
+    for uid in list(st.ATTENDANCE_STORE):
+        st.MemorySessionStore.drop_user(store, uid)
+    store = SnapshotSessionStore()
+    print(f"restart from the snapshot alone: {(time.perf_counter() - t) * 1000:.0f} ms")
+
+    if args.from_db:
+        from_database(store)
+
+
+def from_database(store):
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from attendance.models import Attendance
+    from attendance.store import DatabaseSessionStore
+    from attendance.writebehind import apply_ops
+
+    call_command("migrate", verbosity=0)
+    if not User.objects.filter(username="snap1").exists():
+        User.objects.bulk_create([User(username=f"snap{u}") for u in range(1, USERS + 1)], batch_size=2000)
+    user_ids = dict(User.objects.filter(username__startswith="snap").values_list("username", "id"))
+    Attendance.objects.filter(user_id__in=user_ids.values()).delete()
+    first_pk = 10_000_000
+    ops = [
+        ("put", str(user_ids[f"snap{uid}"]), s.replace(id=str(first_pk + int(uid) * SESSIONS + i)))
+        for uid, entry in store.snapshot().items() for i, s in enumerate(entry["sessions"])
+    ]
+    apply_ops(ops)
+    t = time.perf_counter()
+    loaded = DatabaseSessionStore().snapshot()
+    elapsed = time.perf_counter() - t
+    print(f"from SQLite (DatabaseSessionStore.snapshot): {elapsed:.1f} s for "
+          f"{sum(len(e['sessions']) for e in loaded.values()):,} sessions")
+    # leave the fixture as the other benchmarks expect it
+    Attendance.objects.filter(user_id__in=user_ids.values()).delete()
+
+
+if __name__ == "__main__":
+    main()
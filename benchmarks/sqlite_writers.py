@@ -0,0 +1,93 @@
+# benchmarks/sqlite_writers.py
+# Concurrent writers on SQLite (the attendance/sqlite.py profile).
+#
+# Separate processes share the fixture database. Writers run store cycles
+# (roster read, start, break, status read, end) through DatabaseSessionStore;
+# readers stream the whole attendance table three times with a pause every
+# 100 rows, like a slow CSV download. Prints finished cycles, cycles that
+# failed with "database is locked", and the wall time.
+#
+#   python -m benchmarks.sqlite_writers                      # tuned profile
+#   BENCH_SQLITE_DEFAULTS=1 python -m benchmarks.sqlite_writers   # before it
+#   python -m benchmarks.sqlite_writers --writers 8 --readers 0 --cycles 150
+
+import argparse
+import multiprocessing
+import time
+
+from .common import seed_database, setup
+
+
+def _reader(_):
+    from django.db import OperationalError
+    from attendance.models import Attendance
+
+    errors = 0
+    for _ in range(3):
+        try:
+            for i, _row in enumerate(Attendance.objects.order_by("id").iterator(chunk_size=100)):
+                if i % 100 == 0:
+                    time.sleep(0.1)
+        except OperationalError:
+            errors += 1
+    return 0, errors
+
+
+def _writer(args):
+    worker, cycles = args
+    from django.contrib.auth.models import User
+    from django.db import OperationalError
+    from django.utils import timezone
+    from attendance.records import Break, Session
+    from attendance.store import DatabaseSessionStore
+
+    store = DatabaseSessionStore()
+    users = list(User.objects.filter(username__regex=r"^u\d+$").values_list("id", flat=True))
+    ok = errors = 0
+    for i in range(cycles):
+        uid = users[(worker * 7 + i) % len(users)]
+        try:
+            store.roster()
+            now = timezone.now()
+            sess = store.add_session(uid, Session(None, now))
+            sess = store.save_session(uid, sess.replace(breaks=(Break(now),)))
+            store.active_session(uid)
+            end = timezone.now()
+            store.save_session(uid, sess.replace(end_time=end, is_active=False, breaks=(Break(now, end),)))
+            ok += 1
+        except OperationalError:
+            errors += 1
+    return ok, errors
+
+
+def _run(job):
+    role, args = job
+    setup()
+    return _reader(args) if role == "reader" else _writer(args)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--cycles", type=int, default=100)
+    args = parser.parse_args()
+
+    setup()
+    seed_database()
+    from django.db import connection
+    connection.close()
+
+    jobs = [("reader", None)] * args.readers + [("writer", (w, args.cycles)) for w in range(args.writers)]
+    started = time.perf_counter()
+    with multiprocessing.get_context("spawn").Pool(len(jobs)) as pool:
+        results = pool.map(_run, jobs)
+    wall = time.perf_counter() - started
+    ok = sum(r[0] for r in results)
+    locked = sum(r[1] for r in results)
+    print(f"{args.writers} writers x {args.cycles} cycles, {args.readers} readers: "
+          f"{ok} ok, {locked} \"database is locked\", {wall:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
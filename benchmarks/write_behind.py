@@ -0,0 +1,136 @@
+# benchmarks/write_behind.py
+# Login burst through DatabaseSessionStore vs WriteBehindSessionStore.
+#
+# 1,000 users without a session call _start_attendance() from 32 threads on
+# the fixture database (50 users already clocked in). Prints when every
+# start was acknowledged, when it was all in the database, and the latency.
+#
+#   python -m benchmarks.write_behind --store db
+#   python -m benchmarks.write_behind --store write-behind
+#   python -m benchmarks.write_behind --crash
+#
+# --crash runs 200 users (start, three break toggles, 100 ends, one flush)
+# in a child process with a 30 s batch delay, kills it with os._exit before
+# anything is written, then starts the store again and checks that the
+# replayed database matches what the child had in memory.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import latency_summary, seed_database, setup
+
+STORES = {
+    "db": "attendance.store.DatabaseSessionStore",
+    "write-behind": "attendance.writebehind.WriteBehindSessionStore",
+}
+
+
+def _bulk_users(n):
+    from django.contrib.auth.models import User
+    return list(User.objects.filter(username__startswith="bulk").order_by("id")[:n])
+
+
+def burst(users_count, threads):
+    from django.db import connection
+    from attendance import views
+    from attendance.models import Attendance
+    from attendance.store import get_session_store
+
+    users = _bulk_users(users_count)
+    Attendance.objects.filter(user__in=users).delete()
+    started = time.perf_counter()
+    store = get_session_store()
+    init = time.perf_counter() - started
+
+    latencies = []
+
+    def login(user):
+        t = time.perf_counter()
+        try:
+            _, status = views._start_attendance(user)
+        finally:
+            connection.close()
+        latencies.append(time.perf_counter() - t)
+        return status == 201
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        ok = sum(pool.map(login, users))
+    acked = time.perf_counter() - started
+    if hasattr(store, "journal"):
+        store.journal.flush()
+    durable = time.perf_counter() - started
+    stored = Attendance.objects.filter(user__in=users, is_active=True).count()
+    print(f"{type(store).__name__}: {ok}/{len(users)} started from {threads} threads; "
+          f"acked in {acked:.2f} s ({ok / acked:,.0f}/s), in the database after {durable:.2f} s "
+          f"({stored} rows); {latency_summary(latencies)}; store start {init * 1000:.0f} ms")
+
+
+def _state(store, users):
+    from attendance.records import pack_session
+    return {str(u.id): [pack_session(s) for s in store.user_sessions(u.id)] for u in users}
+
+
+def crash_child(expected_path):
+    from attendance import views
+    from attendance.models import Attendance
+    from attendance.store import get_session_store
+
+    users = _bulk_users(200)
+    Attendance.objects.filter(user__in=users).delete()
+    store = get_session_store()
+    for u in users:
+        views._start_attendance(u)
+        for _ in range(3):
+            views._toggle_break(u)
+    for u in users[:100]:
+        views._end_attendance(u, {})
+    store.flush_user(users[-1].id)
+    with open(expected_path, "w") as f:
+        json.dump(_state(store, users), f)
+    os._exit(0)  # no atexit flush: the journal is all that is left
+
+
+def crash():
+    from django.conf import settings
+    from attendance.store import DatabaseSessionStore, get_session_store
+
+    expected_path = settings.BENCH_DIR / "write_behind_expected.json"
+    subprocess.run([sys.executable, "-m", "benchmarks.write_behind", "--crash-child"], check=True)
+    store = get_session_store()  # replays what the child journaled
+    with open(expected_path) as f:
+        expected = json.load(f)
+    users = _bulk_users(200)
+    same = json.loads(json.dumps(_state(DatabaseSessionStore(), users))) == expected
+    print(f"after the crash: journal segments left {len(store.journal.segments())}, "
+          f"database matches the memory state before the crash: {same}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store", choices=STORES, default="write-behind")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--crash", action="store_true")
+    parser.add_argument("--crash-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    store = STORES["write-behind"] if args.crash or args.crash_child else STORES[args.store]
+    setup(ATTENDANCE_SESSION_STORE=store, ATTENDANCE_WRITE_BEHIND_DELAY=30 if args.crash_child else 0.25)
+    seed_database()
+    if args.crash_child:
+        from django.conf import settings
+        crash_child(settings.BENCH_DIR / "write_behind_expected.json")
+    elif args.crash:
+        crash()
+    else:
+        burst(args.users, args.threads)
+
+
+if __name__ == "__main__":
+    main()